@@ -4,22 +4,40 @@ import datetime
 import os
 import logging
 
+from catalog import CATALOG_FILE, CatalogError, load_catalog
+from channel_plan import ChannelPlan, apply_plan, merge_overwrites, overwrites_equal
+from client_profiles import client_options, log_shard_ready
+from guild_index import GuildIndex
+from journal import JobJournal
+from log_setup import setup_logging
+from metrics import instrument
+from progress import ProgressReporter
+from scheduler import MutationScheduler
+from workflows import create_next_term, format_manifest, plan_rollover
+
 # Setup logging
 log_directory = "logs"
 os.makedirs(log_directory, exist_ok=True)
 log_filename = os.path.join(log_directory, f"log_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log")
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s]: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Log format: see log_setup.setup_logging
+LOG_JSON = False
+setup_logging(log_filename, level=logging.DEBUG, json_lines=LOG_JSON)
 
 logging.info("Bot starting up.")
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Archived channels drop their own overwrites and sync to the archive category, so the whole archived
+# term's permissions are changed with one category edit; False keeps per-channel overwrites
+INHERIT_PERMISSIONS = True
+# Cache profile: see client_profiles
+CLIENT_PROFILE = "lean"
+# Maximum number of next-term channel creations kept in flight, across every running command
+MAX_CONCURRENCY = 8
+scheduler = MutationScheduler(concurrency=MAX_CONCURRENCY)
+# Sharded so the bot scales across many guilds; discord.py picks the shard count
+bot = commands.AutoShardedBot(command_prefix='!', **client_options(CLIENT_PROFILE, prefix_commands=True))
+# Every command and REST call is counted, timed and logged as a span (see metrics.py)
+instrument(bot)
+log_shard_ready(bot)
 
 @bot.event
 async def on_ready():
@@ -39,7 +57,8 @@ def is_admin_or_has_role(role_name):
 
 @bot.command()
 @is_admin_or_has_role("Admin")  # Replace "Admin" with the role name you want to check
-async def archive(ctx, term: str = None):
+async def archive(ctx, term: str = None, mode: str = None):
+    # `!archive spring preview` posts the next-term rollover plan without changing anything
     try:
         logging.debug("Command invoked with term: %s", term)
         if term is None or term.lower() not in ["spring", "summer", "fall"]:
@@ -54,92 +73,98 @@ async def archive(ctx, term: str = None):
         archive_category_name = f"{term.capitalize()} {current_year} Archive"
         logging.debug("Archive category name: %s", archive_category_name)
 
+        try:
+            catalog = load_catalog(CATALOG_FILE)
+        except (OSError, CatalogError) as e:
+            await ctx.send(f"Could not read the course catalog: {e}")
+            logging.error("Could not read the course catalog '%s': %s", CATALOG_FILE, e)
+            return
+
+        index = GuildIndex(ctx.guild)
+        # Every next-term channel (name, category, overwrites) is planned up front from the current channels
+        manifest = plan_rollover(index, term, current_year, catalog)
+        if mode is not None and mode.lower() == "preview":
+            preview = ProgressReporter(ctx.send, label=f"Rollover plan for {term.capitalize()} {current_year}")
+            for line in format_manifest(manifest):
+                preview.detail(line)
+            planned = sum(1 for item in manifest if item.plan is not None)
+            await preview.finish(f'Rollover plan for {term.capitalize()} {current_year}: {planned} channels to create, '
+                                 f'{len(manifest) - planned} skipped. Nothing was changed.', filename="rollover_plan.txt")
+            return
+
+        progress = ProgressReporter(ctx.send, label=f"Archiving {term.capitalize()} {current_year}")
+        await progress.start()
+        # Moves and creations are journaled so re-running after a crash or restart resumes where it stopped
+        # instead of redoing every step (and possibly creating next-term channels twice)
+        journal = JobJournal.open(ctx.guild, f"rollover-{term}-{current_year}")
+        if journal.resumed:
+            progress.detail(f'Resuming an interrupted run: {len(journal.completed)} steps already done.')
+
+        archive_overwrites = {
+            ctx.guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False)
+        }
+
         # Create the archive category if it doesn't exist
-        archive_category = discord.utils.get(ctx.guild.categories, name=archive_category_name)
+        archive_category = index.category(archive_category_name)
         if not archive_category:
-            archive_category = await ctx.guild.create_category(archive_category_name)
-            await archive_category.set_permissions(ctx.guild.default_role, read_messages=True, send_messages=False)
-            await ctx.send(f'Archive category {archive_category_name} created and permissions set.')
-            logging.info("Archive category %s created.", archive_category_name)
+            archive_category = await index.create_category(archive_category_name, overwrites=archive_overwrites)
+            progress.detail(f'Archive category {archive_category_name} created and permissions set.')
         else:
-            await ctx.send(f'Archive category {archive_category_name} already exists.')
-            logging.info("Archive category %s already exists.", archive_category_name)
+            # Channels are about to inherit from the category, so it must carry the archive permissions itself;
+            # overwrites staff added to the category are kept
+            desired = merge_overwrites(archive_category.overwrites, archive_overwrites)
+            if INHERIT_PERMISSIONS and not overwrites_equal(archive_category.overwrites, desired):
+                archive_category = await archive_category.edit(overwrites=desired)
+                progress.detail(f'Archive category {archive_category_name} already exists; permissions updated.')
+            else:
+                progress.detail(f'Archive category {archive_category_name} already exists.')
 
         # Move existing channels to archive and set read-only permissions
         moved_channels = []
-        for channel in ctx.guild.text_channels:
-            if f"-{term}-{current_year}" in channel.name.lower():
-                await channel.edit(category=archive_category)
-                await channel.set_permissions(ctx.guild.default_role, read_messages=True, send_messages=False)
-                moved_channels.append(channel.name)
-                await ctx.send(f'Moved channel: {channel.name}')
-                logging.debug("Moved channel: %s", channel.name)
+        term_channels = index.term(term, current_year)
+        journal.plan({f"move:{channel.id}": {"name": channel.name} for channel in term_channels})
+        progress.total = len(term_channels)
+        for channel in term_channels:
+            # Only trusted while the channel is still in the archive category
+            if journal.is_done(f"move:{channel.id}") and channel.category_id == archive_category.id:
+                await progress.advance(f'Channel {channel.name} was moved by the interrupted run.')
+                moved_channels.append(channel)
+                continue
+            # Inherited channels take the category's overwrites; otherwise keep their own, made read-only
+            overwrites = None
+            if not INHERIT_PERMISSIONS:
+                overwrites = dict(channel.overwrites)
+                overwrites.update(archive_overwrites)
+            plan = ChannelPlan(channel.name, archive_category, overwrites, channel=channel, inherit=INHERIT_PERMISSIONS)
+            if await apply_plan(ctx.guild, plan, index):
+                await progress.advance(f'Moved channel: {channel.name}')
+            else:
+                await progress.advance(f'Channel {channel.name} is already archived.')
+            journal.done(f"move:{channel.id}")
+            moved_channels.append(channel)
 
         if not moved_channels:
-            await ctx.send('No channels were moved.')
-            logging.debug("No channels matched the criteria to move.")
-
-        # Create new channels in the respective categories
-        created_channels = []
-        categories = ['CPT', 'IST', 'SPC', 'HSS', 'SOC']
-        for category_name in categories:
-            category = discord.utils.get(ctx.guild.categories, name=category_name)
-            if category:
-                logging.debug("Processing category: %s", category_name)
-                for channel_name in moved_channels:
-                    if channel_name.lower().startswith(category_name.lower()):
-                        new_channel_name = channel_name.replace(term, get_next_term(term))
-                        if term == "fall":
-                            new_channel_name = new_channel_name.replace(str(current_year), str(current_year + 1))
-
-                        logging.debug("New channel name: %s", new_channel_name)
-
-                        # Check if the channel already exists
-                        existing_channel = discord.utils.get(category.channels, name=new_channel_name)
-                        if existing_channel:
-                            await ctx.send(f'Channel {new_channel_name} already exists in {category_name}.')
-                            logging.debug("Channel %s already exists in %s.", new_channel_name, category_name)
-                            continue
-
-                        # Create the channel
-                        new_channel = await category.create_text_channel(new_channel_name)
-
-                        # Set channel permissions
-                        role_name = '-'.join(new_channel_name.split('-')[:-2])
-                        role = discord.utils.get(ctx.guild.roles, name=role_name)
-                        if role:
-                            overwrites = {
-                                ctx.guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),
-                                role: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-                            }
-                            await new_channel.edit(overwrites=overwrites)
-                            logging.debug("Permissions set for role: %s", role_name)
-                        else:
-                            await ctx.send(f"Role '{role_name}' not found. Permissions for {new_channel_name} were not fully applied.")
-                            logging.debug("Role '%s' not found for %s.", role_name, new_channel_name)
-
-                        await ctx.send(f'Created and set permissions for channel: {new_channel_name}')
-                        created_channels.append(new_channel_name)
-                        logging.info("Created new channel: %s", new_channel_name)
+            progress.detail('No channels were moved.')
+
+        # Create the next-term channels from the manifest, each in a single call with its overwrites
+        progress.label = "Creating next-term channels"
+        progress.done = 0
+        created_channels = await create_next_term(ctx.guild, manifest, index, progress=progress, journal=journal,
+                                                  scheduler=scheduler)
+        for item in manifest:
+            if item.plan is None:
+                progress.detail(f'Skipped {item.name}: {item.note}.')
 
         if not created_channels:
-            await ctx.send('No new channels were created.')
-            logging.debug("No new channels were created.")
+            progress.detail('No new channels were created.')
+        journal.complete()
 
-        await ctx.send(f'Archive process completed for {term.capitalize()} {current_year}.')
+        await progress.finish(f'Archive process completed for {term.capitalize()} {current_year}: '
+                              f'{len(moved_channels)} channels archived, {len(created_channels)} channels created.')
         logging.info("Archive process completed for %s %d.", term.capitalize(), current_year)
     except Exception as e:
         await ctx.send(f'An error occurred: {str(e)}')
         logging.error("An error occurred: %s", str(e))
 
-def get_next_term(current_term):
-    terms = ["spring", "summer", "fall"]
-    try:
-        index = terms.index(current_term)
-        return terms[(index + 1) % len(terms)]
-    except ValueError:
-        logging.debug("Invalid term provided to get_next_term: %s", current_term)
-        return "spring"  # Default to spring if term is invalid
-
 # Replace 'YOUR_BOT_TOKEN' with your actual bot token
 bot.run('')
\ No newline at end of file
@@ -1,115 +1,216 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+import asyncio
 import datetime
 import os
 import logging
 
+from client_profiles import client_options, log_shard_ready
+from command_sync import sync_commands
+from exporter import EXPORT_ROOT
+from jobs import JobQueue
+from log_setup import setup_logging
+from metrics import instrument, start_metrics_server, summary
+from progress import MESSAGE_LIMIT
+from scheduler import MutationScheduler
+from search_index import index_exports, search
+from workflows import archive_term, export_term, populate_channels
+
 # Setup logging
 log_directory = "logs"
 os.makedirs(log_directory, exist_ok=True)
 log_filename = os.path.join(log_directory, f"log_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log")
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s]: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Log format: see log_setup.setup_logging
+LOG_JSON = False
+setup_logging(log_filename, level=logging.DEBUG, json_lines=LOG_JSON)
 
 logging.info("Bot starting up.")
 
 with open("Bot Key.txt", "r", encoding="utf-8") as key_file:
     TOKEN = key_file.readline().strip()
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Maximum number of Discord mutations a single command keeps in flight
+MAX_CONCURRENCY = 8
+# Number of hits /search returns
+SEARCH_RESULTS = 5
+# Guild IDs to sync slash commands to directly (instant, no global propagation); empty syncs globally
+SYNC_GUILD_IDS = []
+
+# Cache profile: see client_profiles
+CLIENT_PROFILE = "lean"
+# Sharded so the bot scales across many guilds; discord.py picks the shard count
+bot = commands.AutoShardedBot(command_prefix='!', **client_options(CLIENT_PROFILE))
 tree = bot.tree
+# Count and time every REST call and command; served on METRICS_PORT and summarised by /stats
+instrument(bot)
+log_shard_ready(bot)
+metrics_runner = None
+# Bulk commands run here in the background: one at a time per guild, several guilds in parallel
+jobs = JobQueue()
+# Every job's mutations go through one scheduler, so its limits and 429 backoffs hold across all of them
+scheduler = MutationScheduler(concurrency=MAX_CONCURRENCY)
 
 @bot.event
 async def on_ready():
+    global metrics_runner
     logging.info(f'Logged in as {bot.user}!')
     print(f'Logged in as {bot.user}!')
+    # on_ready fires again after reconnects; start the endpoint only once
+    if metrics_runner is None:
+        try:
+            metrics_runner = await start_metrics_server()
+        except OSError as e:
+            logging.error("Could not start the metrics endpoint: %s", str(e))
     try:
-        # Sync commands globally
-        await tree.sync()
-        logging.info("Slash commands synchronized globally.")
+        # Only syncs when the command definitions changed since the last sync (see command_sync.py)
+        await sync_commands(tree, guild_ids=SYNC_GUILD_IDS)
     except Exception as e:
         logging.error("Error syncing commands: %s", str(e))
         print(f"Error syncing commands: {str(e)}")
 
+async def queue_job(interaction, kind, description, work):
+    # Run `work` as a background job and answer the interaction right away with its ID
+    job = jobs.submit(interaction.guild, kind, description, work, interaction.channel, interaction.user)
+    ahead = jobs.queued_ahead(job)
+    waiting = f" It starts after {ahead} earlier job(s) in this server." if ahead else ""
+    await interaction.response.send_message(
+        f"Queued job `{job.id}` ({description}).{waiting} Check it with `/job status {job.id}`; "
+        f"the result will be posted in this channel.", ephemeral=True)
+    return job
+
 # Define slash command to archive
 @tree.command(name="archive", description="Archive channels and categories based on a term and year.")
-@app_commands.describe(term="The term to archive (e.g., Spring, Summer, Fall)", year="The year (e.g., 2025)")
-async def archive(interaction: discord.Interaction, term: str, year: int):
-    responded = False
+@app_commands.describe(
+    term="The term to archive (e.g., Spring, Summer, Fall)",
+    year="The year (e.g., 2025)",
+    export="Export any new messages from each channel right before it is archived"
+)
+async def archive(interaction: discord.Interaction, term: str, year: int, export: bool = False):
     try:
-        # Defer the interaction to allow processing time
-        await interaction.response.defer(ephemeral=True)
-        responded = True
         logging.debug("Archive command invoked with term: %s, year: %d", term, year)
 
         # Validate inputs
         if term.lower() not in ["spring", "summer", "fall"]:
-            await interaction.followup.send("Invalid term. Please specify: `Spring`, `Summer`, or `Fall`.", ephemeral=True)
+            await interaction.response.send_message("Invalid term. Please specify: `Spring`, `Summer`, or `Fall`.", ephemeral=True)
             return
         if not (1900 <= year <= 2100):
-            await interaction.followup.send("Invalid year. Please provide a valid year (e.g., 2025).", ephemeral=True)
+            await interaction.response.send_message("Invalid year. Please provide a valid year (e.g., 2025).", ephemeral=True)
             return
 
         term = term.lower()
-        archive_category_name = f"{term.capitalize()} {year} Archive"
         guild = interaction.guild
 
-        # Fetch the Verified role
-        verified_role = discord.utils.get(guild.roles, name="Verified")
-
-        if not verified_role:
-            await interaction.followup.send("The 'Verified' role does not exist. Please create it first.", ephemeral=True)
-            logging.error("Verified role not found.")
-            return
+        async def work(progress):
+            moved_channels = await archive_term(guild, term, year, scheduler=scheduler,
+                                                export_root=EXPORT_ROOT if export else None, progress=progress)
+            logging.info("Archive process completed for %s %d.", term, year)
+            if moved_channels:
+                return f"Archived {len(moved_channels)} channels. Details are in the attached summary."
+            return "No channels found matching the specified term and year."
 
-        # Create the archive category if it doesn't exist
-        archive_category = discord.utils.get(guild.categories, name=archive_category_name)
-        if not archive_category:
-            archive_category = await guild.create_category(archive_category_name)
-            await archive_category.set_permissions(guild.default_role, read_messages=False, send_messages=False)
-            await archive_category.set_permissions(verified_role, read_messages=True, send_messages=False, read_message_history=True)
-            logging.info("Archive category '%s' created.", archive_category_name)
-
-        # Find and move matching channels
-        moved_channels = []
-        for channel in guild.text_channels:
-            logging.debug("Checking channel: %s", channel.name)
-            if f"-{term}-{year}" in channel.name.lower():
-                await channel.edit(category=archive_category)
-
-                # Clear all existing permissions
-                for target in list(channel.overwrites.keys()):
-                    await channel.set_permissions(target, overwrite=None)
-
-                # Apply archive-specific permissions
-                await channel.set_permissions(guild.default_role, read_messages=False, send_messages=False)
-                await channel.set_permissions(verified_role, read_messages=True, send_messages=False, read_message_history=True)
-                moved_channels.append(channel.name)
-                logging.info("Channel '%s' moved to archive and permissions updated.", channel.name)
-
-        if moved_channels:
-            await interaction.followup.send(f"Archived channels: {', '.join(moved_channels)}.", ephemeral=True)
-        else:
-            await interaction.followup.send("No channels found matching the specified term and year.", ephemeral=True)
-        logging.info("Archive process completed for %s %d.", term, year)
+        await queue_job(interaction, "archive", f"Archiving {term.capitalize()} {year}", work)
 
     except Exception as e:
         logging.error("An error occurred in archive: %s", str(e))
         try:
-            if not responded:
-                await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
-            else:
-                await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
+            await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
         except discord.errors.InteractionResponded:
             logging.warning("Interaction already responded when handling archive error.")
 
+# Define slash command to export message history
+@tree.command(name="export", description="Export the message history of a term's channels to compressed archives.")
+@app_commands.describe(
+    term="The term to export (e.g., Spring, Summer, Fall)",
+    year="The year (e.g., 2025)",
+    attachments="Also download attachments into the deduplicated attachment store"
+)
+async def export(interaction: discord.Interaction, term: str, year: int, attachments: bool = False):
+    try:
+        logging.debug("Export command invoked with term: %s, year: %d", term, year)
+
+        # Validate inputs
+        if term.lower() not in ["spring", "summer", "fall"]:
+            await interaction.response.send_message("Invalid term. Please specify: `Spring`, `Summer`, or `Fall`.", ephemeral=True)
+            return
+        if not (1900 <= year <= 2100):
+            await interaction.response.send_message("Invalid year. Please provide a valid year (e.g., 2025).", ephemeral=True)
+            return
+
+        guild = interaction.guild
+
+        async def work(progress):
+            async def report_progress(done, total, channel, count):
+                progress.total = total
+                if count is None:
+                    await progress.advance(f"Failed to export '{channel.name}'.")
+                else:
+                    await progress.advance(f"Exported {count} new messages from '{channel.name}'.")
+
+            exported = await export_term(guild, term.lower(), year, progress=report_progress, attachments=attachments)
+            logging.info("Export completed for %s %d.", term, year)
+            if not exported:
+                return "No channels found matching the specified term and year."
+            failed = [name for name, count in exported.items() if count is None]
+            total = sum(count for count in exported.values() if count)
+            message = f"Exported {total} new messages from {len(exported) - len(failed)} channels."
+            if failed:
+                message += f" Failed: {', '.join(failed)}."
+            # Make the new messages searchable right away
+            indexed = await asyncio.to_thread(index_exports, EXPORT_ROOT)
+            return message + f" Indexed {indexed} messages for /search."
+
+        await queue_job(interaction, "export", f"Exporting {term.capitalize()} {year} channels", work)
+
+    except Exception as e:
+        logging.error("An error occurred in export: %s", str(e))
+        try:
+            await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
+        except discord.errors.InteractionResponded:
+            logging.warning("Interaction already responded when handling export error.")
+
+# Define slash command to search exported archives
+@tree.command(name="search", description="Search the exported message archives.")
+@app_commands.describe(
+    query="Words to search for",
+    subject="Limit to a subject (e.g., CPT)",
+    course="Limit to a course number (e.g., 113)",
+    term="Limit to a term (Spring, Summer, Fall)",
+    year="Limit to a year (e.g., 2025)"
+)
+async def search_archives(
+    interaction: discord.Interaction,
+    query: str,
+    subject: str = None,
+    course: str = None,
+    term: str = None,
+    year: int = None
+):
+    try:
+        logging.debug("Search command invoked with query: %s", query)
+        # Archives include private course channels: only search channels the user can read right now.
+        # Administrators can read everything, including channels that have since been deleted.
+        channel_ids = None
+        if not interaction.user.guild_permissions.administrator:
+            channel_ids = [channel.id for channel in interaction.guild.text_channels
+                           if channel.permissions_for(interaction.user).read_messages]
+        hits = await asyncio.to_thread(search, query, guild_id=interaction.guild.id, subject=subject, course=course,
+                                       term=term, year=year, channel_ids=channel_ids, limit=SEARCH_RESULTS)
+        if not hits:
+            await interaction.response.send_message("No archived messages matched your search.", ephemeral=True)
+            return
+        lines = []
+        for hit in hits:
+            link = f"https://discord.com/channels/{hit['guild_id']}/{hit['channel_id']}/{hit['id']}"
+            lines.append(f"**#{hit['channel']}** {hit['author']} ({hit['created_at'][:10]}): {hit['snippet']} [jump]({link})")
+        await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+    except Exception as e:
+        logging.error("An error occurred in search: %s", str(e))
+        try:
+            await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
+        except discord.errors.InteractionResponded:
+            logging.warning("Interaction already responded when handling search error.")
+
 # Define slash command to populate
 @tree.command(name="populate", description="Create categories and channels dynamically.")
 @app_commands.describe(
@@ -133,70 +234,61 @@ async def populate(
     year: int,
     courses: str
 ):
-    responded = False
     try:
-        # Defer the interaction to allow processing time
-        await interaction.response.defer(ephemeral=True)
-        responded = True
         logging.debug("Populate command invoked with category: %s, term: %s, year: %d, courses: %s",
                       category.value, term, year, courses)
 
         # Validate the term
         if term.lower() not in ["spring", "summer", "fall"]:
-            await interaction.followup.send("Invalid term. Please specify: `Spring`, `Summer`, or `Fall`.", ephemeral=True)
+            await interaction.response.send_message("Invalid term. Please specify: `Spring`, `Summer`, or `Fall`.", ephemeral=True)
             return
 
         if not (1900 <= year <= 2100):
-            await interaction.followup.send("Invalid year. Please provide a valid year (e.g., 2025).", ephemeral=True)
+            await interaction.response.send_message("Invalid year. Please provide a valid year (e.g., 2025).", ephemeral=True)
             return
 
         course_numbers = [course.strip() for course in courses.split(",") if course.strip().isdigit()]
         if not course_numbers:
-            await interaction.followup.send("No valid course numbers provided. Please provide a comma-separated list of numbers.", ephemeral=True)
+            await interaction.response.send_message("No valid course numbers provided. Please provide a comma-separated list of numbers.", ephemeral=True)
             return
 
-        # Create the category if it does not exist
         guild = interaction.guild
-        category_name = category.value
-        existing_category = discord.utils.get(guild.categories, name=category_name)
-        if not existing_category:
-            existing_category = await guild.create_category(category_name)
-            logging.info("Category '%s' created.", category_name)
-
-        # Create channels under the category as private and assign roles
-        created_channels = []
-        for course_number in course_numbers:
-            channel_name = f"{category_name}-{course_number}-{term.capitalize()}-{year}"
-            existing_channel = discord.utils.get(guild.text_channels, name=channel_name)
-            if not existing_channel:
-                role_name = f"{category_name}-{course_number}"
-                role = discord.utils.get(guild.roles, name=role_name)
-                lab_tech_role = discord.utils.get(guild.roles, name="Lab Tech")
-                if not role:
-                    logging.warning("Role '%s' not found for channel '%s'.", role_name, channel_name)
-                    continue
-                overwrites = {
-                    guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                    role: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-                    lab_tech_role: discord.PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True)
-                }
-                new_channel = await guild.create_text_channel(name=channel_name, category=existing_category, overwrites=overwrites)
-                created_channels.append(new_channel.name)
-                logging.info("Channel '%s' created as private with role '%s' assigned.", new_channel.name, role_name)
-
-        if created_channels:
-            await interaction.followup.send(f"Created private channels with roles: {', '.join(created_channels)}", ephemeral=True)
-        else:
-            await interaction.followup.send("No new channels were created. All channels already exist or roles were missing.", ephemeral=True)
+
+        async def work(progress):
+            created_channels = await populate_channels(guild, category.value, term, year, course_numbers,
+                                                       scheduler=scheduler, progress=progress)
+            if created_channels:
+                return f"Created {len(created_channels)} private channels with roles. Details are in the attached summary."
+            return "No new channels were created. All channels already exist or roles were missing."
+
+        await queue_job(interaction, "populate", f"Populating {category.value}", work)
 
     except Exception as e:
         logging.error("An error occurred in populate: %s", str(e))
         try:
-            if not responded:
-                await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
-            else:
-                await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
+            await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
         except discord.errors.InteractionResponded:
             logging.warning("Interaction already responded when handling populate error.")
 
+job_group = app_commands.Group(name="job", description="Background jobs started by bulk commands.")
+
+@job_group.command(name="status", description="Show a background job, or this server's recent jobs.")
+@app_commands.describe(job_id="The job ID returned when the job was queued")
+async def job_status(interaction: discord.Interaction, job_id: str = None):
+    if job_id:
+        job = jobs.get(job_id.strip(), guild_id=interaction.guild.id)
+        text = job.describe() if job else f"No job `{job_id}` in this server."
+    else:
+        recent = jobs.for_guild(interaction.guild.id)[:10]
+        text = "\n".join(job.describe() for job in recent) or "No jobs have run in this server yet."
+    await interaction.response.send_message(text[:MESSAGE_LIMIT], ephemeral=True)
+
+tree.add_command(job_group)
+
+@tree.command(name="stats", description="Show API call counts, rate-limit waits and command latencies.")
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def stats(interaction: discord.Interaction):
+    await interaction.response.send_message(f"```\n{summary()[:1900]}\n```", ephemeral=True)
+
 bot.run(TOKEN)
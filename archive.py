@@ -2,6 +2,11 @@ import discord
 from discord.ext import commands
 import datetime
 
+from catalog import CATALOG_FILE, load_catalog
+from guild_index import GuildIndex
+from progress import ProgressReporter
+from workflows import create_next_term, format_manifest, plan_rollover
+
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
@@ -29,7 +34,7 @@ def is_admin_or_has_role(role_name):
 
 @bot.command()
 @is_admin_or_has_role("Admin")  # Replace "Admin" with the role name you want to check
-async def archive(ctx, term: str = None):
+async def archive(ctx, term: str = None, mode: str = None):
     try:
         if term is None:
             await ctx.send("I don't know what term you want to archive. Please specify a term like `Spring`, `Summer`, or `Fall`.")
@@ -37,15 +42,27 @@ async def archive(ctx, term: str = None):
         
         current_year = datetime.datetime.now().year
         archive_category_name = f"{term.capitalize()} {current_year} Archive"
+        # Plan every next-term channel before anything moves; `!archive spring preview` only posts the plan
+        index = GuildIndex(ctx.guild)
+        manifest = plan_rollover(index, term.lower(), current_year, load_catalog(CATALOG_FILE))
+        if mode is not None and mode.lower() == "preview":
+            preview = ProgressReporter(ctx.send)
+            for line in format_manifest(manifest):
+                preview.detail(line)
+            await preview.finish(f'Rollover plan for {term} {current_year} attached. Nothing was changed.',
+                                 filename="rollover_plan.txt")
+            return
+        progress = ProgressReporter(ctx.send, label=f"Archiving {term.capitalize()} {current_year}")
+        await progress.start()
         
         # Create the archive category if it doesn't exist
         archive_category = discord.utils.get(ctx.guild.categories, name=archive_category_name)
         if not archive_category:
             archive_category = await ctx.guild.create_category(archive_category_name)
             await archive_category.set_permissions(ctx.guild.default_role, read_messages=True, send_messages=False)
-            await ctx.send(f'Archive category {archive_category_name} created and permissions set.')
+            progress.detail(f'Archive category {archive_category_name} created and permissions set.')
         else:
-            await ctx.send(f'Archive category {archive_category_name} already exists.')
+            progress.detail(f'Archive category {archive_category_name} already exists.')
         
         # Move existing channels to archive and set read-only permissions
         moved_channels = []
@@ -54,48 +71,21 @@ async def archive(ctx, term: str = None):
                 await channel.edit(category=archive_category)
                 await channel.set_permissions(ctx.guild.default_role, read_messages=True, send_messages=False)
                 moved_channels.append(channel.name)
-                await ctx.send(f'Moved channel: {channel.name}')
+                await progress.advance(f'Moved channel: {channel.name}')
         
         if not moved_channels:
-            await ctx.send('No channels were moved.')
+            progress.detail('No channels were moved.')
+
+        # Create the next-term channels from the manifest, each in a single call with its overwrites
+        progress.label = "Creating next-term channels"
+        progress.done = 0
+        created_channels = await create_next_term(ctx.guild, manifest, index, progress=progress)
 
-        # Create new channels in the respective categories
-        created_channels = []
-        categories = ['CPT', 'IST', 'SPC', 'HSS', 'SOC']
-        for category_name in categories:
-            category = discord.utils.get(ctx.guild.categories, name=category_name)
-            if category:
-                for channel_name in moved_channels:
-                    if channel_name.lower().startswith(category_name.lower()):
-                        new_channel_name = channel_name.replace(term.lower(), get_next_term(term.lower()))
-                        if term.lower() == "fall":
-                            new_channel_name = new_channel_name.replace(str(current_year), str(current_year + 1))
-                        
-                        # Create the channel with specific permissions
-                        new_channel = await category.create_text_channel(new_channel_name)
-                        
-                        # Set channel permissions
-                        role_name = '-'.join(new_channel_name.split('-')[:-2])
-                        role = discord.utils.get(ctx.guild.roles, name=role_name)
-                        if role:
-                            overwrites = {
-                                ctx.guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),
-                                role: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-                            }
-                            await new_channel.edit(overwrites=overwrites)
-                        
-                        await ctx.send(f'Created and set permissions for channel: {new_channel_name}')
-                        created_channels.append(new_channel_name)
-        
         if not created_channels:
-            await ctx.send('No new channels were created.')
+            progress.detail('No new channels were created.')
 
-        await ctx.send(f'Archive process completed for {term} {current_year}.')
+        await progress.finish(f'Archive process completed for {term} {current_year}: '
+                              f'{len(moved_channels)} channels archived, {len(created_channels)} channels created.')
     except Exception as e:
         await ctx.send(f'An error occurred: {str(e)}')
         print(f'[ERROR] {str(e)}')
-
-def get_next_term(current_term):
-    terms = ["spring", "summer", "fall"]
-    index = terms.index(current_term)
-    return terms[(index + 1) % len(terms)]
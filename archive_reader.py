@@ -0,0 +1,142 @@
+import bisect
+import json
+import mmap
+import os
+
+from exporter import (EXPORT_ROOT, FRAME_INDEX_ENTRY, channel_directory, decompress_frame, frame_index_path,
+                      parse_segment_name)
+
+# Random access into exported archives. Every segment has a sidecar .idx file listing its frames
+# by message ID range and byte offset; the reader memory-maps those indexes, binary-searches for the
+# frame holding a message and decodes only that frame (plus neighbours when a context window spills
+# over), so a single lookup costs one small read no matter how large the archive is.
+
+class FrameIndex:
+    # Memory-mapped view of one segment's sidecar index
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.count = size // FRAME_INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, frame):
+        # (first message ID, last message ID, offset, length)
+        return FRAME_INDEX_ENTRY.unpack_from(self._map, frame * FRAME_INDEX_ENTRY.size)
+
+    def find(self, message_id):
+        # Index of the frame whose ID range contains message_id, or None
+        first_ids = _FirstIds(self)
+        frame = bisect.bisect_right(first_ids, message_id) - 1
+        if frame < 0:
+            return None
+        first_id, last_id, _, _ = self[frame]
+        return frame if first_id <= message_id <= last_id else None
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+
+class _FirstIds:
+    # Lazy sequence of each frame's first message ID, for bisect
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, frame):
+        return self._index[frame][0]
+
+
+class ChannelArchive:
+    # All segments of one exported channel, addressed frame by frame in message ID order
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        for filename in sorted(os.listdir(directory)):
+            parsed = parse_segment_name(filename)
+            path = os.path.join(directory, filename)
+            if parsed and os.path.exists(frame_index_path(path)):
+                self.segments.append((path, parsed[1], FrameIndex(frame_index_path(path))))
+        self.segments = [segment for segment in self.segments if len(segment[2])]
+
+    @classmethod
+    def open(cls, guild_id, channel_id, root=EXPORT_ROOT):
+        return cls(channel_directory(root, guild_id, channel_id))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for _, _, index in self.segments:
+            index.close()
+
+    def _locate(self, message_id):
+        # (segment number, frame number) of the frame containing message_id, or None
+        last_ids = [index[len(index) - 1][1] for _, _, index in self.segments]
+        segment = bisect.bisect_left(last_ids, message_id)
+        if segment == len(self.segments):
+            return None
+        frame = self.segments[segment][2].find(message_id)
+        return None if frame is None else (segment, frame)
+
+    def read_frame(self, segment, frame):
+        path, codec, index = self.segments[segment]
+        _, _, offset, length = index[frame]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = decompress_frame(codec, f.read(length))
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+    def _neighbour(self, position, step):
+        segment, frame = position
+        frame += step
+        while 0 <= segment < len(self.segments):
+            if 0 <= frame < len(self.segments[segment][2]):
+                return segment, frame
+            segment += step
+            if 0 <= segment < len(self.segments):
+                frame = 0 if step > 0 else len(self.segments[segment][2]) - 1
+        return None
+
+    def get(self, message_id):
+        # The exported record of one message, or None if it is not in the archive
+        position = self._locate(message_id)
+        if position is None:
+            return None
+        for record in self.read_frame(*position):
+            if record["id"] == message_id:
+                return record
+        return None
+
+    def context(self, message_id, before=5, after=5):
+        # The message with up to `before` earlier and `after` later messages, oldest first
+        position = self._locate(message_id)
+        if position is None:
+            return []
+        records = self.read_frame(*position)
+        target = next((i for i, record in enumerate(records) if record["id"] == message_id), None)
+        if target is None:
+            return []
+        window = records[max(target - before, 0):target + after + 1]
+        missing_before = before - target
+        previous = position
+        while missing_before > 0 and (previous := self._neighbour(previous, -1)):
+            earlier = self.read_frame(*previous)
+            window = earlier[-missing_before:] + window
+            missing_before -= len(earlier)
+        missing_after = after - (len(records) - target - 1)
+        following = position
+        while missing_after > 0 and (following := self._neighbour(following, 1)):
+            later = self.read_frame(*following)
+            window = window + later[:missing_after]
+            missing_after -= len(later)
+        return window
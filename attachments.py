@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import uuid
+
+import aiohttp
+
+# Content-addressed attachment store for exports. Files are streamed to disk in chunks while
+# being hashed and kept once under BLOB_ROOT/ab/cd/<sha256>, however many times they were posted.
+# A small SQLite table maps Discord attachment IDs to their hash, so re-exporting a message whose
+# attachment is already stored costs no download at all. Discord does not expose a content hash up
+# front, so a repost under a new attachment ID is downloaded once to hash it but not stored again.
+
+BLOB_ROOT = os.path.join("exports", "blobs")
+DOWNLOAD_CONNECTIONS = 8
+CHUNK_SIZE = 256 * 1024
+
+
+def blob_path(root, digest):
+    return os.path.join(root, digest[:2], digest[2:4], digest)
+
+
+class AttachmentDownloader:
+    # Use as `async with AttachmentDownloader() as downloader:` so the pooled session is closed
+    def __init__(self, root=BLOB_ROOT, connections=DOWNLOAD_CONNECTIONS):
+        self.root = root
+        self.connections = connections
+        self.session = None
+        self.db = None
+        self.downloaded = 0
+        self.deduplicated = 0
+        self._pending = {}
+
+    async def __aenter__(self):
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.root, "attachments.sqlite"))
+        self.db.execute("CREATE TABLE IF NOT EXISTS attachments (id INTEGER PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER)")
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.db.commit()
+        self.db.close()
+
+    def known(self, attachment_id):
+        row = self.db.execute("SELECT sha256 FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+        return row[0] if row else None
+
+    async def store(self, attachment):
+        # `attachment` is an exported attachment record (id, filename, size, url); returns its sha256
+        digest = self.known(attachment["id"])
+        if digest:
+            return digest
+        # Two messages in flight can reference the same attachment; download it only once
+        if attachment["id"] not in self._pending:
+            self._pending[attachment["id"]] = asyncio.ensure_future(self._download(attachment))
+        try:
+            return await asyncio.shield(self._pending[attachment["id"]])
+        finally:
+            task = self._pending.get(attachment["id"])
+            if task is not None and task.done():
+                del self._pending[attachment["id"]]
+
+    async def _download(self, attachment):
+        tmp_path = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        try:
+            async with self.session.get(attachment["url"]) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        hasher.update(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+            digest = hasher.hexdigest()
+            path = blob_path(self.root, digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self.downloaded += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.db.execute("INSERT OR REPLACE INTO attachments (id, sha256, size) VALUES (?, ?, ?)",
+                        (attachment["id"], digest, attachment.get("size")))
+        return digest
+
+    async def store_records(self, records):
+        # Fill in "sha256" on every attachment of a page of exported message records
+        attachments = [attachment for record in records for attachment in record["attachments"]]
+        if not attachments:
+            return
+        digests = await asyncio.gather(*(self.store(attachment) for attachment in attachments), return_exceptions=True)
+        for attachment, digest in zip(attachments, digests):
+            if isinstance(digest, Exception):
+                logging.error("Failed to download attachment %s (%s): %s", attachment["id"], attachment["filename"], digest)
+                attachment["sha256"] = None
+            else:
+                attachment["sha256"] = digest
+        self.db.commit()
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+import tracemalloc
+
+import discord
+
+from client_profiles import CLIENT_PROFILES, client_options
+from fake_discord import FakeAPI, SUBJECTS, seed_guild, snowflake
+from scheduler import MutationScheduler
+from workflows import archive_term, create_course_roles, for_each_guild, populate_channels, update_labtech_rw_access
+
+# Offline benchmark: runs the bot workflows against a synthetic in-memory guild and reports
+# wall time, API calls per route, 429s hit and peak memory.
+#
+#   python benchmark.py --channels 400 --latency 0.05 --rate-limit-every 50
+#
+# With --profiles it instead compares the client cache profiles: the same synthetic gateway traffic
+# (one GUILD_CREATE, plus member chunks and MESSAGE_CREATE events where the intents would deliver
+# them) is fed through discord.py's own cache for each profile and the memory it retains is reported.
+#
+#   python benchmark.py --profiles --channels 2000 --members 50000 --messages 20000
+
+TERM = "spring"
+YEAR = 2025
+
+
+def _workflows(args):
+    async def archive(guild, scheduler):
+        return await archive_term(guild, TERM, YEAR, journal_root=args.journal_root, scheduler=scheduler)
+
+    async def populate(guild, scheduler):
+        courses = sorted({role.name.split("-")[1] for role in guild.roles if role.name.startswith("CPT-")})
+        return await populate_channels(guild, "CPT", "summer", YEAR, courses, scheduler=scheduler)
+
+    async def create_roles(guild, scheduler):
+        # Half the catalog already exists in the seeded guild, the other half is new
+        per_subject = max(args.roles // len(SUBJECTS), 1)
+        catalog = {subject: list(range(100 + per_subject // 2, 100 + per_subject // 2 + per_subject)) for subject in SUBJECTS}
+        return await create_course_roles(guild, catalog, scheduler=scheduler)
+
+    async def labtech(guild, scheduler):
+        return await update_labtech_rw_access(guild, TERM, YEAR, scheduler=scheduler)
+
+    return {"archive": archive, "populate": populate, "create_roles": create_roles, "update_labtech_rw_access": labtech}
+
+
+async def run_one(name, workflow, args):
+    # All guilds share one API, as they would share one bot token
+    api = FakeAPI(latency=args.latency, rate_limit_every=args.rate_limit_every, retry_after=args.retry_after)
+    guilds = [seed_guild(channels=args.channels, roles=args.roles, term=TERM, year=YEAR, api=api) for _ in range(args.guilds)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    # One scheduler for every guild, as a bot process has
+    scheduler = MutationScheduler(concurrency=args.concurrency)
+    results = await for_each_guild(guilds, workflow, guild_concurrency=args.guild_concurrency, scheduler=scheduler)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "name": name,
+        "elapsed": elapsed,
+        "items": sum(len(result) for result in results.values() if not isinstance(result, Exception)),
+        "calls": dict(api.calls),
+        "total_calls": api.total,
+        "rate_limited": sum(api.rate_limited.values()),
+        "peak_bytes": peak,
+    }
+
+
+def _guild_payload(guild_id, channels, roles, members):
+    role = {"permissions": "0", "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}
+    return {
+        "id": str(guild_id),
+        "name": "Synthetic",
+        "member_count": members,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": [{**role, "id": str(guild_id), "name": "@everyone", "position": 0}] +
+                 [{**role, "id": str(snowflake()), "name": f"ROLE-{i}", "position": i + 1} for i in range(roles)],
+        "channels": [{"id": str(snowflake()), "type": 0, "name": f"channel-{i}", "position": i, "permission_overwrites": []}
+                     for i in range(channels)],
+    }
+
+
+def _user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None, "global_name": None}
+
+
+def _member_payload(user_id):
+    return {"user": _user_payload(user_id), "roles": [], "joined_at": "2025-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+            "flags": 0}
+
+
+def _message_payload(guild_id, channel_id, user_id):
+    return {
+        "id": str(snowflake()), "channel_id": str(channel_id), "guild_id": str(guild_id), "type": 0,
+        "author": _user_payload(user_id), "member": {key: value for key, value in _member_payload(user_id).items() if key != "user"},
+        "content": "Synthetic message content " * 4, "timestamp": "2025-01-01T00:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+        "pinned": False,
+    }
+
+
+def run_profile(profile, args):
+    # Memory the client's cache retains after the synthetic gateway traffic its intents would receive
+    options = client_options(profile, prefix_commands=args.prefix_commands)
+    intents = options["intents"]
+    if args.members_intent and profile == "default":
+        # Deployments that turned on the privileged members intent also chunk and cache every member
+        intents.members = True
+    guild_id = snowflake()
+    payload = _guild_payload(guild_id, args.channels, args.roles, args.members)
+    channel_ids = [int(channel["id"]) for channel in payload["channels"]]
+    user_ids = [snowflake() for _ in range(args.members)]
+    if intents.members and options.get("chunk_guilds_at_startup", True):
+        # What chunking at startup would deliver
+        payload["members"] = [_member_payload(user_id) for user_id in user_ids]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    client = discord.Client(**options)
+    state = client._connection
+    state._add_guild(discord.Guild(data=payload, state=state))
+    del payload
+    messages = 0
+    if intents.guild_messages:
+        for i in range(args.messages):
+            state.parse_message_create(_message_payload(guild_id, channel_ids[i % len(channel_ids)],
+                                                        user_ids[i % len(user_ids)] if user_ids else snowflake()))
+            messages += 1
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    guild = state._get_guild(guild_id)
+    return {
+        "name": profile,
+        "elapsed": elapsed,
+        "events": messages,
+        "cached_members": len(guild.members),
+        "cached_messages": len(client.cached_messages),
+        "retained_bytes": retained,
+        "peak_bytes": peak,
+    }
+
+
+def report_profiles(results):
+    for result in results:
+        print(f"{result['name']}: {result['retained_bytes'] / 1024 / 1024:.2f} MiB retained "
+              f"(peak {result['peak_bytes'] / 1024 / 1024:.2f} MiB), {result['cached_members']} members and "
+              f"{result['cached_messages']} messages cached, {result['events']} message events, {result['elapsed']:.3f}s")
+
+
+def report(results):
+    for result in results:
+        print(f"{result['name']}: {result['elapsed']:.3f}s, {result['items']} items, "
+              f"{result['total_calls']} API calls ({result['rate_limited']} rate limited), "
+              f"peak {result['peak_bytes'] / 1024 / 1024:.2f} MiB")
+        for route, count in sorted(result["calls"].items()):
+            print(f"    {count:>7}  {route}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot workflows against a synthetic guild.")
+    parser.add_argument("--channels", type=int, default=1000, help="Course channels in the synthetic guild (100-20000)")
+    parser.add_argument("--roles", type=int, default=None, help="Course roles in the synthetic guild (defaults to --channels)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per API call")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth API call with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="retry_after carried by injected 429s")
+    parser.add_argument("--concurrency", type=int, default=8, help="Scheduler concurrency limit")
+    parser.add_argument("--guilds", type=int, default=1, help="Synthetic guilds, each seeded like the first")
+    parser.add_argument("--guild-concurrency", type=int, default=4, help="Guilds processed at once")
+    parser.add_argument("--only", choices=["archive", "populate", "create_roles", "update_labtech_rw_access"], action="append",
+                        help="Run only the named workflow (repeatable)")
+    parser.add_argument("--profiles", action="store_true", help="Compare client cache profiles instead of running workflows")
+    parser.add_argument("--members", type=int, default=10000, help="Guild members (--profiles)")
+    parser.add_argument("--messages", type=int, default=5000, help="MESSAGE_CREATE events (--profiles)")
+    parser.add_argument("--members-intent", action="store_true",
+                        help="Give the default profile the members intent, as some deployments enable it (--profiles)")
+    parser.add_argument("--prefix-commands", action="store_true",
+                        help="Profile a bot with prefix commands, which still receives message events (--profiles)")
+    args = parser.parse_args()
+    if args.roles is None:
+        args.roles = args.channels
+
+    # Keep per-call logging out of the measurements
+    logging.disable(logging.CRITICAL)
+    if args.profiles:
+        report_profiles([run_profile(profile, args) for profile in CLIENT_PROFILES])
+        return
+    workflows = _workflows(args)
+    results = []
+    # Job journals are written (and fsynced) as in production, but into a throwaway directory
+    with tempfile.TemporaryDirectory() as args.journal_root:
+        for name, workflow in workflows.items():
+            if args.only and name not in args.only:
+                continue
+            results.append(asyncio.run(run_one(name, workflow, args)))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
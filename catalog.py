@@ -0,0 +1,52 @@
+import csv
+import os
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11; CSV catalogs still work
+    tomllib = None
+
+# Course catalog: which courses each subject offers, in the order their roles should be listed.
+# Kept in a data file (TOML or CSV) instead of in the scripts, so onboarding a department is an
+# edit to the catalog rather than to code.
+#
+#   TOML:  CPT = [113, 168, 170]          CSV:  subject,course
+#          IST = [110, 190]                     CPT,113
+
+CATALOG_FILE = "course_catalog.toml"
+
+
+class CatalogError(Exception):
+    pass
+
+
+def load_catalog(path=CATALOG_FILE):
+    # {subject: [course numbers]} in file order, subjects uppercased and duplicate courses dropped
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        if tomllib is None:
+            raise CatalogError("Reading a TOML catalog needs Python 3.11 or newer; use a CSV catalog instead.")
+        with open(path, "rb") as f:
+            rows = [(subject, course) for subject, courses in tomllib.load(f).items() for course in courses]
+    elif extension == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = [(row["subject"], row["course"]) for row in csv.DictReader(f)]
+    else:
+        raise CatalogError(f"Unsupported catalog format '{extension}'; use .toml or .csv.")
+
+    catalog = {}
+    for subject, course in rows:
+        subject = str(subject).strip().upper()
+        try:
+            course = int(course)
+        except (TypeError, ValueError):
+            raise CatalogError(f"Invalid course number '{course}' for subject '{subject}' in '{path}'.") from None
+        courses = catalog.setdefault(subject, [])
+        if course not in courses:
+            courses.append(course)
+    return catalog
+
+
+def course_role_names(catalog):
+    # "{SUBJECT}-{course}" for every course, in catalog order
+    return [f"{subject}-{course}" for subject, courses in catalog.items() for course in courses]
@@ -0,0 +1,47 @@
+import re
+from collections import namedtuple
+
+TERMS = ["spring", "summer", "fall"]
+
+# "cpt-113-spring-2025" -> subject, course, term, year; matched against the lowercased name
+CHANNEL_PATTERN = re.compile(r'^(?P<subject>[a-z]+)-(?P<course>\d+)-(?P<term>spring|summer|fall)-(?P<year>\d{4})$')
+# "CPT-113" (roles) or the leading part of a course channel name
+COURSE_PATTERN = re.compile(r'^(?P<subject>[a-z]+)-(?P<course>\d+)(?:-|$)')
+
+
+class CourseChannel(namedtuple("CourseChannel", ["subject", "course", "term", "year"])):
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return f"{self.subject}-{self.course}"
+
+    @property
+    def name(self):
+        return f"{self.subject}-{self.course}-{self.term}-{self.year}"
+
+
+def parse_channel_name(name):
+    # Returns a CourseChannel for term channel names, or None for anything else
+    match = CHANNEL_PATTERN.match(name.lower())
+    if not match:
+        return None
+    return CourseChannel(match["subject"], match["course"], match["term"], int(match["year"]))
+
+
+def course_key(name):
+    # "CPT-113", "cpt-113-spring-2025" and "CPT-113-Spring-2025" all map to "cpt-113"
+    match = COURSE_PATTERN.match(name.lower())
+    if not match:
+        return None
+    return f"{match['subject']}-{match['course']}"
+
+
+def next_term(term):
+    return TERMS[(TERMS.index(term) + 1) % len(TERMS)]
+
+
+def rollover(record):
+    # The same course in the following term; fall rolls over into spring of the next year
+    year = record.year + 1 if record.term == "fall" else record.year
+    return record._replace(term=next_term(record.term), year=year)
@@ -0,0 +1,96 @@
+import logging
+
+import discord
+
+from scheduler import channel_bucket, guild_bucket
+
+
+def normalize_channel_name(name):
+    # Discord stores text channel names lowercased with spaces turned into dashes
+    return "-".join(name.lower().split())
+
+
+def overwrites_equal(current, desired):
+    # Compare overwrite maps by target id so role/member objects from different caches still match
+    current_by_id = {target.id: overwrite for target, overwrite in current.items()}
+    desired_by_id = {target.id: overwrite for target, overwrite in desired.items()}
+    return current_by_id == desired_by_id
+
+
+def merge_overwrites(current, desired):
+    # `current` with the targets in `desired` replaced, keeping any other target (e.g. a role staff added)
+    desired_ids = {target.id for target in desired}
+    merged = {target: overwrite for target, overwrite in current.items() if target.id not in desired_ids}
+    merged.update(desired)
+    return merged
+
+
+class ChannelPlan:
+    # Desired end state of one text channel: its name, parent category and full overwrite map.
+    # `channel` is the existing channel to reconcile, or None when the channel still has to be created.
+    # With `inherit` the channel carries no overwrites of its own beyond the category's and is synced to it,
+    # so later permission changes only need one edit on the category.
+    def __init__(self, name, category, overwrites=None, channel=None, inherit=False):
+        self.name = normalize_channel_name(name)
+        self.category = category
+        self.inherit = inherit
+        if inherit:
+            overwrites = category.overwrites if category else {}
+        # Drop missing targets (e.g. a role that does not exist in this guild)
+        self.overwrites = {target: overwrite for target, overwrite in (overwrites or {}).items() if target is not None}
+        self.channel = channel
+
+    def changes(self):
+        # Keyword arguments for a single channel.edit() that brings the channel to the desired state
+        if self.channel is None:
+            return {}
+        changes = {}
+        if self.channel.name != self.name:
+            changes["name"] = self.name
+        # category_id rather than .category, which is None for channels fetched over REST without a cache
+        current_category_id = self.channel.category_id
+        desired_category_id = self.category.id if self.category else None
+        if current_category_id != desired_category_id:
+            changes["category"] = self.category
+        if not overwrites_equal(self.channel.overwrites, self.overwrites):
+            changes["overwrites"] = self.overwrites
+        if self.inherit and changes.keys() & {"category", "overwrites"}:
+            # Clear the channel's own overwrites and sync to the category in the same edit. The category's
+            # overwrites are sent explicitly too, since discord.py only copies them from its cache.
+            changes["overwrites"] = self.overwrites
+            changes["sync_permissions"] = True
+        return changes
+
+    @property
+    def action(self):
+        if self.channel is None:
+            return "create"
+        return "edit" if self.changes() else "skip"
+
+
+async def apply_plan(guild: discord.Guild, plan: ChannelPlan, index=None):
+    # Send at most one REST call for the plan; returns the channel, or None when nothing had to change.
+    # When a GuildIndex is given, created or renamed channels are recorded in it.
+    action = plan.action
+    if action == "create":
+        channel = await guild.create_text_channel(name=plan.name, category=plan.category, overwrites=plan.overwrites)
+        logging.debug("Created channel '%s' in one call.", plan.name)
+        if index is not None:
+            index.add_channel(channel)
+        return channel
+    if action == "edit":
+        changes = plan.changes()
+        await plan.channel.edit(**changes)
+        logging.debug("Edited channel '%s' (%s) in one call.", plan.channel.name, ", ".join(changes))
+        if index is not None:
+            index.add_channel(plan.channel)
+        return plan.channel
+    logging.debug("Channel '%s' already matches its plan. Skipping.", plan.name)
+    return None
+
+
+def plan_bucket(guild, plan):
+    # New channels go through the guild-wide channel creation route, edits through the channel's own route
+    if plan.channel is None:
+        return guild_bucket(guild, "channels")
+    return channel_bucket(plan.channel)
@@ -0,0 +1,43 @@
+import logging
+
+import discord
+
+# Client construction options per cache profile. "default" is what the bots always ran with: the
+# default intents plus message content, the default member cache and a 1000-message cache. "lean"
+# keeps only what archive/populate/export actually read from the cache (guilds, channels, roles):
+# no member cache or chunking and no message cache. Anything else a command needs (message history,
+# members) is fetched over REST when it is needed.
+
+CLIENT_PROFILES = ("default", "lean")
+
+
+def log_shard_ready(bot):
+    # Log each shard's guild count as it comes up; its guilds are usable then, before on_ready fires
+    # for the whole bot
+    async def on_shard_ready(shard_id):
+        guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+        logging.info("Shard %d ready with %d guilds.", shard_id, guilds)
+
+    bot.add_listener(on_shard_ready)
+
+
+def client_options(profile="lean", prefix_commands=False):
+    # Keyword arguments for discord.Client / commands.Bot. Bots with prefix commands (`!archive`) also
+    # need guild message events and their content, but still cache neither members nor messages.
+    if profile == "default":
+        intents = discord.Intents.default()
+        intents.message_content = True
+        return {"intents": intents}
+    if profile != "lean":
+        raise ValueError(f"Unknown client profile '{profile}'; expected one of {', '.join(CLIENT_PROFILES)}.")
+    intents = discord.Intents.none()
+    intents.guilds = True
+    if prefix_commands:
+        intents.guild_messages = True
+        intents.message_content = True
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
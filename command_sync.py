@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+
+import discord
+
+from exporter import load_json, save_json
+
+# Slash command sync gated on a hash of the command payloads. The hash last synced for each scope
+# (global, or one guild) is kept in SYNC_STATE_FILE, so a restart with unchanged commands costs no
+# sync call, and a reconnect within the same process never syncs again. Guild-scoped syncs show up
+# immediately; global syncs can take a while to propagate and are rate limited more strictly.
+# Switching to guild scope clears the global commands once, or those guilds would list every command twice.
+# Switching back to global scope does not remove the guild copies; sync an empty tree to those guilds for that.
+
+SYNC_STATE_FILE = "command_sync.json"
+
+# Scopes already checked by this process
+_checked = set()
+
+
+def command_tree_hash(tree, guild=None):
+    # The exact payload tree.sync() would send for this scope, hashed
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    return _payload_hash(payload)
+
+
+def _payload_hash(payload):
+    payload = sorted(payload, key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def sync_commands(tree, guild_ids=(), state_path=SYNC_STATE_FILE):
+    # Sync every scope whose commands changed since its last sync. With `guild_ids` the global commands
+    # are copied into and synced to each of those guilds instead of globally, for instant availability.
+    # Returns the scopes synced.
+    application_id = tree.client.application_id
+    state = load_json(state_path, {})
+    guilds = [discord.Object(id=guild_id) for guild_id in guild_ids]
+    for guild in guilds:
+        tree.copy_global_to(guild=guild)
+
+    synced = []
+    global_scope = f"{application_id}:global"
+    if guilds and global_scope not in _checked:
+        # The tree still holds the global commands (they are only copied), so clear them directly
+        if state.get(global_scope) != _payload_hash([]):
+            await tree.client.http.bulk_upsert_global_commands(application_id, payload=[])
+            state[global_scope] = _payload_hash([])
+            save_json(state_path, state)
+            synced.append(global_scope)
+            logging.info("Global slash commands cleared; commands are synced per guild.")
+        _checked.add(global_scope)
+
+    for guild in guilds or [None]:
+        scope = f"{application_id}:{guild.id if guild else 'global'}"
+        if scope in _checked:
+            continue
+        digest = command_tree_hash(tree, guild)
+        if state.get(scope) == digest:
+            logging.info("Slash commands for %s unchanged; skipping sync.", scope)
+            _checked.add(scope)
+            continue
+        # A failed sync raises before the scope is marked, so the next on_ready tries again
+        await tree.sync(guild=guild)
+        _checked.add(scope)
+        state[scope] = digest
+        save_json(state_path, state)
+        synced.append(scope)
+        logging.info("Slash commands synchronized for %s.", scope)
+    return synced
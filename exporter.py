@@ -0,0 +1,372 @@
+import asyncio
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import struct
+
+import discord
+
+try:
+    import zstandard
+except ImportError:  # gzip is always available; zstd is used when the package is installed
+    zstandard = None
+
+# Message history export: each channel is streamed oldest-first into compressed JSONL segment
+# files under EXPORT_ROOT/{guild_id}/{channel_id}/. Segments are written as a series of
+# independently compressed frames (zstd frames or gzip members), and a checkpoint is saved after
+# every frame, so an interrupted export truncates back to the last complete frame and resumes
+# from the last written message ID instead of starting over.
+#
+# Exports are incremental: EXPORT_ROOT/{guild_id}/state.json keeps the high-water mark (last
+# exported message ID) of every channel, each run only fetches messages after that mark and
+# appends them as a new segment, and channels with nothing new are skipped without an API call.
+
+EXPORT_ROOT = "exports"
+FRAME_MESSAGES = 1000
+SEGMENT_MESSAGES = 100_000
+# Channels fetched at once, and how many 100-message pages may wait for each channel's writer
+EXPORT_CONCURRENCY = 4
+PAGE_MESSAGES = 100
+QUEUE_PAGES = 8
+
+CODEC_EXTENSIONS = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+EXTENSION_CODECS = {extension: codec for codec, extension in CODEC_EXTENSIONS.items()}
+# "segment-00000.jsonl.gz" -> segment number and codec extension
+SEGMENT_PATTERN = re.compile(r"^segment-(\d+)(" + "|".join(map(re.escape, EXTENSION_CODECS)) + r")$")
+
+# Sidecar frame index written next to each segment: one fixed-width little-endian record per frame
+# holding (first message ID, last message ID, byte offset, byte length), see archive_reader.py
+FRAME_INDEX_ENTRY = struct.Struct("<QQQQ")
+
+
+def default_codec():
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def compress_frame(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to write zstd segments.")
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def decompress_frame(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read zstd segments.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class _RangeReader:
+    # File-like view of bytes [start, end) of an open file, so a decoder stops at the last complete frame
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self._f = f
+        self._remaining = None if end is None else end - start
+
+    def read(self, size=-1):
+        if self._remaining is None:
+            return self._f.read(size)
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readable(self):
+        return True
+
+
+def iter_segment_records(path, codec, start=0, end=None):
+    # Stream the JSON records of a segment's frames between byte offsets `start` and `end`
+    with open(path, "rb") as f:
+        reader = _RangeReader(f, start, end)
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is required to read zstd segments.")
+            stream = zstandard.ZstdDecompressor().stream_reader(reader, read_across_frames=True)
+        else:
+            stream = gzip.GzipFile(fileobj=reader)
+        for line in io.TextIOWrapper(stream, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
+
+
+def channel_directory(root, guild_id, channel_id):
+    return os.path.join(root, str(guild_id), str(channel_id))
+
+
+def segment_path(directory, segment, codec):
+    return os.path.join(directory, f"segment-{segment:05d}{CODEC_EXTENSIONS[codec]}")
+
+
+def parse_segment_name(filename):
+    # (segment number, codec) of a segment file name, or None for any other file
+    match = SEGMENT_PATTERN.match(filename)
+    if not match:
+        return None
+    return int(match[1]), EXTENSION_CODECS[match[2]]
+
+
+def frame_index_path(path):
+    # "segment-00000.jsonl.gz" -> "segment-00000.idx"
+    return path.split(".jsonl")[0] + ".idx"
+
+
+def load_json(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def save_json(path, data):
+    # Write to a temporary file and rename it over the old one so a crash never leaves half a file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def serialize_message(message):
+    return {
+        "id": message.id,
+        "channel_id": message.channel.id,
+        "guild_id": message.guild.id if message.guild else None,
+        "author_id": message.author.id if message.author else None,
+        "author": str(message.author) if message.author else None,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "attachments": [
+            {"id": attachment.id, "filename": attachment.filename, "size": attachment.size, "url": attachment.url}
+            for attachment in message.attachments
+        ],
+        "reference_id": message.reference.message_id if message.reference else None,
+    }
+
+
+class ExportState:
+    # Persistent per-guild store of the last exported message ID of each channel
+    def __init__(self, root, guild_id):
+        self.path = os.path.join(root, str(guild_id), "state.json")
+        self.marks = load_json(self.path, {})
+
+    def mark(self, channel_id):
+        return self.marks.get(str(channel_id))
+
+    def update(self, channel_id, last_message_id):
+        if last_message_id is None or self.marks.get(str(channel_id)) == last_message_id:
+            return
+        self.marks[str(channel_id)] = last_message_id
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        save_json(self.path, self.marks)
+
+
+class SegmentWriter:
+    # Appends compressed frames of JSON lines to a channel's segment files and checkpoints after each frame
+    def __init__(self, directory, codec=None, frame_messages=FRAME_MESSAGES, segment_messages=SEGMENT_MESSAGES):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+        self.frame_messages = frame_messages
+        self.segment_messages = segment_messages
+        os.makedirs(directory, exist_ok=True)
+
+        checkpoint = load_json(self.checkpoint_path)
+        if checkpoint:
+            # Resume with the codec the existing segments were written with
+            self.codec = checkpoint["codec"]
+            self.segment = checkpoint["segment"]
+            self.offset = checkpoint["offset"]
+            self.segment_count = checkpoint["segment_count"]
+            self.last_message_id = checkpoint["last_message_id"]
+            self.total = checkpoint["total"]
+            if checkpoint.get("complete") and self.segment_count:
+                # The previous run finished cleanly; this run's messages go into a new segment
+                self.segment += 1
+                self.offset = 0
+                self.segment_count = 0
+        else:
+            self.codec = codec or default_codec()
+            self.segment = 0
+            self.offset = 0
+            self.segment_count = 0
+            self.last_message_id = None
+            self.total = 0
+        self.complete = False
+        self._lines = []
+        self._frame_first_id = None
+        self._frame_last_id = None
+        self._truncate_partial_frame()
+
+    def _truncate_partial_frame(self):
+        # Anything past the checkpointed offset is a frame that was cut off mid-write
+        path = segment_path(self.directory, self.segment, self.codec)
+        if os.path.exists(path) and os.path.getsize(path) > self.offset:
+            logging.warning("Truncating partial frame in '%s' back to offset %d.", path, self.offset)
+            with open(path, "r+b") as f:
+                f.truncate(self.offset)
+        # Drop frame index entries for frames that are not in the segment any more
+        index_path = frame_index_path(path)
+        if os.path.exists(index_path):
+            with open(index_path, "r+b") as f:
+                data = f.read()
+                keep = 0
+                for entry in range(len(data) // FRAME_INDEX_ENTRY.size):
+                    _, _, offset, length = FRAME_INDEX_ENTRY.unpack_from(data, entry * FRAME_INDEX_ENTRY.size)
+                    if offset + length > self.offset:
+                        break
+                    keep += 1
+                f.truncate(keep * FRAME_INDEX_ENTRY.size)
+
+    def checkpoint(self):
+        return {
+            "codec": self.codec,
+            "segment": self.segment,
+            "offset": self.offset,
+            "segment_count": self.segment_count,
+            "last_message_id": self.last_message_id,
+            "total": self.total,
+            "complete": self.complete,
+        }
+
+    async def add(self, record):
+        if not self._lines:
+            self._frame_first_id = record["id"]
+        self._lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._frame_last_id = record["id"]
+        if len(self._lines) >= self.frame_messages:
+            await self.flush()
+
+    async def flush(self):
+        if not self._lines:
+            return
+        lines, self._lines = self._lines, []
+        await asyncio.to_thread(self._write_frame, lines, self._frame_first_id, self._frame_last_id)
+
+    def _write_frame(self, lines, first_message_id, last_message_id):
+        if self.segment_count >= self.segment_messages:
+            self.segment += 1
+            self.offset = 0
+            self.segment_count = 0
+        frame = compress_frame(self.codec, ("\n".join(lines) + "\n").encode("utf-8"))
+        path = segment_path(self.directory, self.segment, self.codec)
+        # A segment starting at offset 0 is opened fresh: a crash after writing the first frame of a rotated
+        # segment but before its checkpoint leaves that frame behind, and it must not be appended to
+        mode = "ab" if self.offset else "wb"
+        with open(path, mode) as f:
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(frame_index_path(path), mode) as f:
+            f.write(FRAME_INDEX_ENTRY.pack(first_message_id, last_message_id, self.offset, len(frame)))
+            f.flush()
+            os.fsync(f.fileno())
+        self.offset += len(frame)
+        self.segment_count += len(lines)
+        self.total += len(lines)
+        self.last_message_id = last_message_id
+        save_json(self.checkpoint_path, self.checkpoint())
+
+    async def finish(self):
+        await self.flush()
+        self.complete = True
+        save_json(self.checkpoint_path, self.checkpoint())
+
+
+async def export_channel(channel: discord.TextChannel, root=EXPORT_ROOT, codec=None, state=None, queue_pages=QUEUE_PAGES,
+                         downloader=None):
+    # Fetch only the messages after the channel's high-water mark and append them as a new segment;
+    # an interrupted run resumes after the last checkpointed message. With an AttachmentDownloader,
+    # attachments are stored by content hash before their page is handed to the writer.
+    state = state or ExportState(root, channel.guild.id)
+    mark = state.mark(channel.id)
+    if mark is not None and channel.last_message_id is not None and channel.last_message_id <= mark:
+        logging.debug("Channel '%s' has no messages after %d. Skipping.", channel.name, mark)
+        return 0
+
+    directory = channel_directory(root, channel.guild.id, channel.id)
+    writer = SegmentWriter(directory, codec=codec)
+    # Channel metadata, so the search indexer can attribute segments without asking Discord
+    save_json(os.path.join(directory, "channel.json"), {
+        "id": channel.id,
+        "name": channel.name,
+        "guild_id": channel.guild.id,
+        "category": channel.category.name if channel.category else None,
+    })
+    after_id = max(writer.last_message_id or 0, mark or 0)
+    after = discord.Object(id=after_id) if after_id else None
+
+    # The fetcher hands pages to the writer through a bounded queue, so a slow disk
+    # pauses the fetcher instead of letting fetched pages pile up in memory
+    queue = asyncio.Queue(maxsize=queue_pages)
+
+    async def put(page):
+        if downloader:
+            await downloader.store_records(page)
+        await queue.put(page)
+
+    async def fetch():
+        try:
+            page = []
+            async for message in channel.history(limit=None, after=after, oldest_first=True):
+                page.append(serialize_message(message))
+                if len(page) >= PAGE_MESSAGES:
+                    await put(page)
+                    page = []
+            if page:
+                await put(page)
+        finally:
+            await queue.put(None)
+
+    fetcher = asyncio.ensure_future(fetch())
+    exported = 0
+    try:
+        while (page := await queue.get()) is not None:
+            for record in page:
+                await writer.add(record)
+            exported += len(page)
+        # Re-raises a fetch error after everything fetched so far has been written
+        await fetcher
+    except BaseException:
+        fetcher.cancel()
+        await writer.flush()
+        raise
+    await writer.finish()
+    state.update(channel.id, writer.last_message_id)
+    logging.info("Exported %d messages from '%s' (%d in total).", exported, channel.name, writer.total)
+    return exported
+
+
+async def export_channels(channels, root=EXPORT_ROOT, concurrency=EXPORT_CONCURRENCY, progress=None, downloader=None):
+    # Export several channels at once, at most `concurrency` in flight. `progress`, if given, is
+    # awaited as progress(done, total, channel, exported) after each channel; `exported` is None on failure.
+    # Returns {channel: messages exported, or None if its export failed}.
+    semaphore = asyncio.Semaphore(concurrency)
+    states = {}
+    results = {}
+    done = 0
+
+    async def run(channel):
+        nonlocal done
+        state = states.setdefault(channel.guild.id, ExportState(root, channel.guild.id))
+        async with semaphore:
+            try:
+                results[channel] = await export_channel(channel, root=root, state=state, downloader=downloader)
+            except Exception as e:
+                logging.error("Failed to export channel '%s': %s", channel.name, e)
+                results[channel] = None
+        done += 1
+        if progress:
+            await progress(done, len(channels), channel, results[channel])
+
+    await asyncio.gather(*(run(channel) for channel in channels))
+    return {channel: results[channel] for channel in channels}
@@ -0,0 +1,313 @@
+import asyncio
+import datetime
+import itertools
+from collections import Counter
+
+import discord
+
+# In-memory stand-in for the parts of discord.Guild / channels / roles the workflows use,
+# so workflows can be run and measured offline. Every call that would hit Discord's REST API goes
+# through FakeAPI, which counts it per route and can inject latency and 429 responses.
+
+SUBJECTS = ["CPT", "IST", "SPC", "SOC", "HSS", "HIS", "MAT", "ENG", "BIO", "CHM", "PHY", "PSY"]
+TERMS = ["spring", "summer", "fall"]
+
+_snowflakes = itertools.count(1_100_000_000_000_000_000)
+
+
+def snowflake():
+    return next(_snowflakes)
+
+
+class FakeResponse:
+    # Minimal aiohttp-like response so discord.HTTPException can be raised from the fake
+    def __init__(self, status, reason, headers=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class FakeAPI:
+    # Counts calls per route; sleeps `latency` seconds per call and answers every
+    # `rate_limit_every`-th call with a 429 carrying `retry_after`
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=0.05):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.total = 0
+
+    async def request(self, route):
+        self.calls[route] += 1
+        self.total += 1
+        call_number = self.total
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit_every and call_number % self.rate_limit_every == 0:
+            self.rate_limited[route] += 1
+            response = FakeResponse(429, "Too Many Requests", {"Retry-After": str(self.retry_after)})
+            exc = discord.HTTPException(response, {"message": "You are being rate limited.", "retry_after": self.retry_after})
+            exc.retry_after = self.retry_after
+            raise exc
+
+    def reset(self):
+        self.calls.clear()
+        self.rate_limited.clear()
+        self.total = 0
+
+
+class FakeRole:
+    def __init__(self, guild, name, position=0, role_id=None):
+        self.guild = guild
+        self.id = role_id or snowflake()
+        self.name = name
+        self.position = position
+
+    def is_default(self):
+        return self.id == self.guild.id
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+    def __repr__(self):
+        return f"<FakeRole name={self.name!r}>"
+
+
+class FakeMessage:
+    def __init__(self, channel, content, author=None, message_id=None, attachments=None, created_at=None):
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.id = message_id or snowflake()
+        self.content = content
+        self.author = author
+        self.attachments = attachments or []
+        self.embeds = []
+        self.reference = None
+        self.created_at = created_at or datetime.datetime.now(datetime.timezone.utc)
+        self.edited_at = None
+
+
+class FakeUser:
+    def __init__(self, name, administrator=False, roles=None):
+        self.id = snowflake()
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.roles = roles or []
+        self.guild_permissions = discord.Permissions(administrator=administrator)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuildChannel:
+    type = None
+
+    def __init__(self, guild, name, category=None, overwrites=None, position=0):
+        self.guild = guild
+        self.id = snowflake()
+        self.name = name
+        self.category = category
+        self.position = position
+        self._overwrites = dict(overwrites or {})
+
+    @property
+    def category_id(self):
+        return self.category.id if self.category else None
+
+    @property
+    def overwrites(self):
+        return dict(self._overwrites)
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def set_permissions(self, target, *, overwrite=discord.utils.MISSING, reason=None, **permissions):
+        if overwrite is None:
+            await self.guild.api.request("DELETE /channels/{channel_id}/permissions/{overwrite_id}")
+            self._overwrites.pop(target, None)
+            return
+        await self.guild.api.request("PUT /channels/{channel_id}/permissions/{overwrite_id}")
+        if overwrite is discord.utils.MISSING:
+            overwrite = discord.PermissionOverwrite(**permissions)
+        self._overwrites[target] = overwrite
+
+    async def edit(self, *, reason=None, **options):
+        await self.guild.api.request("PATCH /channels/{channel_id}")
+        if "name" in options:
+            self.name = options["name"]
+        if "position" in options:
+            self.position = options["position"]
+        if "category" in options:
+            self.category = options["category"]
+        if "overwrites" in options:
+            self._overwrites = dict(options["overwrites"])
+        if options.get("sync_permissions") and self.category is not None:
+            self._overwrites = self.category.overwrites
+        return self
+
+    async def delete(self, *, reason=None):
+        await self.guild.api.request("DELETE /channels/{channel_id}")
+        self.guild._channels.pop(self.id, None)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} name={self.name!r}>"
+
+
+class FakeCategory(FakeGuildChannel):
+    type = discord.ChannelType.category
+
+    @property
+    def channels(self):
+        return [channel for channel in self.guild.channels if channel.category is self]
+
+    @property
+    def text_channels(self):
+        return [channel for channel in self.channels if channel.type == discord.ChannelType.text]
+
+    async def create_text_channel(self, name, **options):
+        return await self.guild.create_text_channel(name, category=self, **options)
+
+
+class FakeTextChannel(FakeGuildChannel):
+    type = discord.ChannelType.text
+
+    def __init__(self, guild, name, category=None, overwrites=None, position=0):
+        super().__init__(guild, name, category, overwrites, position)
+        self.topic = None
+        # Oldest first, like the IDs Discord hands out
+        self.messages = []
+
+    @property
+    def last_message_id(self):
+        return self.messages[-1].id if self.messages else None
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api.request("POST /channels/{channel_id}/messages")
+        message = FakeMessage(self, content)
+        self.messages.append(message)
+        return message
+
+    async def history(self, *, limit=100, before=None, after=None, around=None, oldest_first=None):
+        # Paginated like discord.py: one API call per page of up to 100 messages
+        if oldest_first is None:
+            oldest_first = after is not None
+        before_id = getattr(before, "id", before)
+        after_id = getattr(after, "id", after)
+        selected = [message for message in self.messages
+                    if (before_id is None or message.id < before_id) and (after_id is None or message.id > after_id)]
+        if not oldest_first:
+            selected.reverse()
+        if limit is not None:
+            selected = selected[:limit]
+        for start in range(0, max(len(selected), 1), 100):
+            await self.guild.api.request("GET /channels/{channel_id}/messages")
+            for message in selected[start:start + 100]:
+                yield message
+
+
+class FakeGuild:
+    def __init__(self, name="Fake Guild", api=None):
+        self.api = api or FakeAPI()
+        self.id = snowflake()
+        self.name = name
+        self.default_role = FakeRole(self, "@everyone", role_id=self.id)
+        self._roles = {self.default_role.id: self.default_role}
+        self._channels = {}
+
+    @property
+    def roles(self):
+        return sorted(self._roles.values(), key=lambda role: role.position)
+
+    @property
+    def channels(self):
+        return list(self._channels.values())
+
+    @property
+    def text_channels(self):
+        return [channel for channel in self._channels.values() if channel.type == discord.ChannelType.text]
+
+    @property
+    def categories(self):
+        return [channel for channel in self._channels.values() if channel.type == discord.ChannelType.category]
+
+    # Seeding helpers: add objects without going through the API
+    def add_role(self, name):
+        role = FakeRole(self, name, position=len(self._roles))
+        self._roles[role.id] = role
+        return role
+
+    def add_category(self, name, overwrites=None):
+        category = FakeCategory(self, name, overwrites=overwrites)
+        self._channels[category.id] = category
+        return category
+
+    def add_text_channel(self, name, category=None, overwrites=None):
+        channel = FakeTextChannel(self, name, category=category, overwrites=overwrites)
+        self._channels[channel.id] = channel
+        return channel
+
+    # API surface used by the workflows
+    async def create_role(self, *, name="new role", reason=None, **fields):
+        await self.api.request("POST /guilds/{guild_id}/roles")
+        return self.add_role(name)
+
+    async def create_category(self, name, *, overwrites=discord.utils.MISSING, reason=None, position=None):
+        await self.api.request("POST /guilds/{guild_id}/channels")
+        return self.add_category(name, overwrites=None if overwrites is discord.utils.MISSING else overwrites)
+
+    async def create_text_channel(self, name, *, category=None, overwrites=discord.utils.MISSING, reason=None, **options):
+        await self.api.request("POST /guilds/{guild_id}/channels")
+        return self.add_text_channel(name.lower(), category=category,
+                                     overwrites=None if overwrites is discord.utils.MISSING else overwrites)
+
+    async def edit_role_positions(self, positions, *, reason=None):
+        await self.api.request("PATCH /guilds/{guild_id}/roles")
+        for role, position in positions.items():
+            role.position = position
+        return self.roles
+
+    async def fetch_channels(self):
+        await self.api.request("GET /guilds/{guild_id}/channels")
+        return self.channels
+
+def seed_guild(channels=1000, roles=None, term="spring", year=2025, messages_per_channel=0, api=None):
+    # Synthetic guild: one role per course plus "Verified" and "Lab Tech", one category per subject,
+    # and `channels` course channels spread over the terms leading up to (and including) term/year
+    guild = FakeGuild(name=f"Synthetic {channels}", api=api)
+    roles = channels if roles is None else roles
+    guild.add_role("Verified")
+    lab_tech_role = guild.add_role("Lab Tech")
+
+    courses = [(SUBJECTS[i % len(SUBJECTS)], 100 + i // len(SUBJECTS)) for i in range(max(channels, roles))]
+    course_roles = {}
+    for subject, course in courses[:roles]:
+        course_roles[(subject, course)] = guild.add_role(f"{subject}-{course}")
+    categories = {subject: guild.add_category(subject) for subject in SUBJECTS}
+
+    # Walk backwards through the terms so the newest term has the most channels
+    terms = []
+    term_index, term_year = TERMS.index(term), year
+    for _ in range(3):
+        terms.append((TERMS[term_index], term_year))
+        term_index -= 1
+        if term_index < 0:
+            term_index, term_year = len(TERMS) - 1, term_year - 1
+
+    author = FakeUser("student")
+    for i in range(channels):
+        subject, course = courses[i // len(terms)]
+        channel_term, channel_year = terms[i % len(terms)]
+        role = course_roles.get((subject, course))
+        overwrites = {guild.default_role: discord.PermissionOverwrite(read_messages=False)}
+        if role:
+            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        overwrites[lab_tech_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True)
+        channel = guild.add_text_channel(f"{subject.lower()}-{course}-{channel_term}-{channel_year}",
+                                         category=categories[subject], overwrites=overwrites)
+        for n in range(messages_per_channel):
+            channel.messages.append(FakeMessage(channel, f"Message {n} in {channel.name}", author=author))
+    return guild
@@ -0,0 +1,95 @@
+import discord
+
+from channel_names import course_key, parse_channel_name
+
+
+class GuildIndex:
+    # Snapshot of a guild's channels, categories and roles, built once per command so lookups
+    # are dict hits instead of discord.utils.get scans. Objects created through the index (or
+    # passed to add_*) are indexed immediately so later lookups in the same command see them.
+    # Like discord.utils.get, a duplicated name resolves to the first object seen under it.
+    def __init__(self, guild: discord.Guild, channels=None, roles=None):
+        self.guild = guild
+        self.default_role = guild.default_role
+        # Channel names map to buckets so a rename falls back to the next channel of the same name
+        self.channels = {}
+        self.categories = {}
+        self.roles = {}
+        self.course_roles = {}
+        # Parsed course channels: channel id -> CourseChannel, plus (term, year) buckets
+        self.parsed = {}
+        self.term_channels = {}
+        self._channel_names = {}
+        for channel in (guild.channels if channels is None else channels):
+            self.add_channel(channel)
+        for role in (guild.roles if roles is None else roles):
+            self.add_role(role)
+
+    def add_channel(self, channel):
+        # Dispatch on channel.type rather than the class so REST-fetched and stand-in channels index the same way
+        if channel.type == discord.ChannelType.category:
+            self.categories.setdefault(channel.name, channel)
+            return channel
+        if channel.type not in (discord.ChannelType.text, discord.ChannelType.news):
+            return channel
+        # Drop the entry under the old name if the channel was renamed
+        old_name = self._channel_names.get(channel.id)
+        if old_name is not None and old_name != channel.name.lower():
+            self._discard(self.channels, old_name, channel)
+            record = self.parsed.pop(channel.id, None)
+            if record:
+                self._discard(self.term_channels, (record.term, record.year), channel)
+        name = channel.name.lower()
+        self._channel_names[channel.id] = name
+        self._append(self.channels, name, channel)
+        record = parse_channel_name(name)
+        if record:
+            self.parsed[channel.id] = record
+            self._append(self.term_channels, (record.term, record.year), channel)
+        return channel
+
+    # Buckets map channel id -> channel so adds and removals stay O(1) and keep insertion order
+    @staticmethod
+    def _append(buckets, key, channel):
+        buckets.setdefault(key, {})[channel.id] = channel
+
+    @staticmethod
+    def _discard(buckets, key, channel):
+        bucket = buckets.get(key, {})
+        bucket.pop(channel.id, None)
+        if not bucket:
+            buckets.pop(key, None)
+
+    def add_role(self, role):
+        self.roles.setdefault(role.name, role)
+        key = course_key(role.name)
+        if key:
+            self.course_roles.setdefault(key, role)
+        return role
+
+    def channel(self, name):
+        return next(iter(self.channels.get(name.lower(), {}).values()), None)
+
+    def term(self, term, year):
+        # Course channels of one term, e.g. index.term("spring", 2025)
+        return list(self.term_channels.get((term.lower(), int(year)), {}).values())
+
+    def category(self, name):
+        return self.categories.get(name)
+
+    def role(self, name):
+        return self.roles.get(name)
+
+    async def create_category(self, name, **kwargs):
+        return self.add_channel(await self.guild.create_category(name, **kwargs))
+
+    async def create_role(self, **kwargs):
+        return self.add_role(await self.guild.create_role(**kwargs))
+
+
+async def fetch_guild_index(client: discord.Client, guild_id):
+    # Index a guild over REST alone, for clients that never connect to the gateway: one call returns
+    # the guild with its roles, a second its channels
+    guild = await client.fetch_guild(guild_id, with_counts=False)
+    channels = await guild.fetch_channels()
+    return GuildIndex(guild, channels=channels)
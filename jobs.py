@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from log_setup import span
+from metrics import JOB_SECONDS, JOBS
+from progress import ProgressReporter
+
+# In-process background jobs for long bulk commands. A command validates its input, submits the
+# work and answers with a job ID straight away, so nothing depends on the 15-minute interaction
+# token. Jobs in the same guild run one after another (they would fight over the same channels and
+# rate-limit buckets); jobs in different guilds run in parallel, up to JOB_WORKERS at once. Progress
+# is kept on the job for /job status and the outcome is posted to the invoking channel when it ends.
+
+JOB_WORKERS = 4
+# Finished jobs kept for /job status
+JOB_HISTORY = 100
+
+
+class Job:
+    def __init__(self, guild_id, kind, description, work, channel, user=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.guild_id = guild_id
+        self.kind = kind
+        self.description = description
+        self.channel = channel
+        self.user = user
+        self.status = "queued"
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._work = work
+        # Nothing is posted while the job runs; advance() just counts and finish() posts the result
+        self.progress = ProgressReporter(channel.send, label=description)
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def describe(self):
+        line = f"`{self.id}` {self.description}: {self.status}"
+        if self.status == "running":
+            line += f" ({self.progress.status()}, {time.time() - self.started_at:.0f}s)"
+        elif self.finished:
+            line += f" after {self.finished_at - self.started_at:.0f}s: {self.result}"
+        return line
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.history = history
+        self.jobs = {}
+        self._workers = asyncio.Semaphore(workers)
+        self._guild_locks = {}
+        # The event loop only keeps weak references to tasks; hold them until they finish
+        self._tasks = set()
+
+    def submit(self, guild, kind, description, work, channel, user=None):
+        # `work(progress)` does the job and returns the text to post when it is done; returns the Job
+        job = Job(guild.id, kind, description, work, channel, user)
+        self.jobs[job.id] = job
+        self._trim()
+        task = asyncio.ensure_future(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logging.info("Queued job %s (%s) in guild %s.", job.id, description, guild.id)
+        return job
+
+    def get(self, job_id, guild_id=None):
+        job = self.jobs.get(job_id)
+        if job is None or (guild_id is not None and job.guild_id != guild_id):
+            return None
+        return job
+
+    def for_guild(self, guild_id):
+        # Newest first
+        return [job for job in reversed(self.jobs.values()) if job.guild_id == guild_id]
+
+    def queued_ahead(self, job):
+        return sum(1 for other in self.jobs.values()
+                   if other.guild_id == job.guild_id and not other.finished and other.created_at < job.created_at)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job):
+        lock = self._guild_locks.setdefault(job.guild_id, asyncio.Lock())
+        async with lock, self._workers:
+            job.status = "running"
+            job.started_at = time.time()
+            with span("job", level=logging.INFO, kind=job.kind, job=job.id, guild=job.guild_id) as fields:
+                try:
+                    job.result = await job._work(job.progress)
+                    job.status = "done"
+                except Exception as e:
+                    logging.error("Job %s (%s) failed: %s", job.id, job.description, str(e))
+                    job.result = f"Failed: {e}"
+                    job.status = "failed"
+                fields["status"] = job.status
+            job.finished_at = time.time()
+            JOBS.inc(kind=job.kind, status=job.status)
+            JOB_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind)
+            mention = f"{job.user.mention} " if job.user else ""
+            await job.progress.finish(f"{mention}Job `{job.id}` ({job.description}) {job.status}: {job.result}")
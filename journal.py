@@ -0,0 +1,117 @@
+import functools
+import json
+import logging
+import os
+
+# Write-ahead journal for bulk guild jobs. Before a job touches Discord it records every planned
+# step; each step is marked done (fsynced) the moment its API call succeeds. Re-running an
+# interrupted job with the same name replays the journal and skips the steps already done, so a
+# crash, restart or expired interaction token costs neither a rescan nor duplicate channels.
+# Callers only trust a done step while the guild still agrees (the channel exists, or sits in the
+# archive category). Steps that fail for good are recorded as failed; once every step is done or
+# failed the journal is set aside as <job>.jsonl.completed and the next run starts fresh.
+
+JOURNAL_ROOT = "journals"
+
+
+class JobJournal:
+    # `path` None keeps the journal in memory only (nothing survives a restart)
+    def __init__(self, path=None):
+        self.path = path
+        self.planned = {}
+        self.completed = {}
+        self.failed_steps = {}
+        if path is not None:
+            self._replay()
+
+    @classmethod
+    def open(cls, guild, job, root=JOURNAL_ROOT):
+        # e.g. JobJournal.open(guild, "archive-spring-2025"); root None disables journaling
+        if root is None:
+            return cls()
+        directory = os.path.join(root, str(guild.id))
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{job}.jsonl"))
+
+    def _replay(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        good = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good += len(line)
+            if entry["op"] == "plan":
+                self.planned[entry["step"]] = entry.get("data")
+            elif entry["op"] == "done":
+                self.completed[entry["step"]] = entry.get("result")
+            # "failed" entries are not replayed: a resumed run retries those steps
+        if good < len(data):
+            # A crash mid-write leaves a torn last line; drop it so new entries start on a clean line
+            logging.warning("Dropping %d bytes of a torn entry at the end of journal '%s'.", len(data) - good, self.path)
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        if self.completed:
+            logging.info("Resuming job from '%s': %d of %d steps already done.", self.path, len(self.completed),
+                         len(self.planned))
+
+    def _append(self, entries):
+        if self.path is None or not entries:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @property
+    def resumed(self):
+        return bool(self.completed)
+
+    def plan(self, steps):
+        # Record {step: data} before any of it runs; steps already in the journal are kept as they are
+        new = {step: data for step, data in steps.items() if step not in self.planned}
+        self.planned.update(new)
+        self._append([{"op": "plan", "step": step, "data": data} for step, data in new.items()])
+
+    def is_done(self, step):
+        return step in self.completed
+
+    def result(self, step):
+        return self.completed.get(step)
+
+    def done(self, step, result=None):
+        self.completed[step] = result
+        self._append([{"op": "done", "step": step, "result": result}])
+
+    def failed(self, step, error):
+        self.failed_steps[step] = error
+        self._append([{"op": "failed", "step": step, "error": error}])
+
+    def pending(self):
+        # Steps neither done nor failed, i.e. the ones an interruption left unfinished
+        return [step for step in self.planned if step not in self.completed and step not in self.failed_steps]
+
+    def wrap(self, step, func):
+        # `func` that marks `step` done (with the ID of what it returned, if any) once it succeeds
+        @functools.wraps(func)
+        async def run(*args, **kwargs):
+            result = await func(*args, **kwargs)
+            self.done(step, getattr(result, "id", None))
+            return result
+        return run
+
+    def complete(self):
+        # Every step is done or failed; set the journal aside so the next run of this job starts from scratch
+        if self.path is not None and os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.completed")
+        self.planned.clear()
+        self.completed.clear()
+        self.failed_steps.clear()
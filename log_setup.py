@@ -0,0 +1,80 @@
+import atexit
+import contextlib
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+# Logging that never touches the disk from the event loop: records go through a QueueHandler and a
+# QueueListener thread does the file writes. Optionally writes JSON lines instead of plain text.
+# span() logs how long a block took, with any extra fields attached; metrics.instrument() logs one for every
+# command and REST call through log_span().
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s]: %(message)s'
+LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+# Attributes every LogRecord has; anything else on a record came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, LOG_DATEFMT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def setup_logging(filename, level=logging.DEBUG, json_lines=False):
+    # Drop-in replacement for logging.basicConfig(filename=..., ...) that writes from a background thread.
+    # json_lines=True writes one JSON object per record instead of text, for feeding into log tooling.
+    handler = logging.FileHandler(filename, encoding="utf-8")
+    handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    # Safe to call more than once (e.g. explicitly and again at exit)
+    if listener._thread is not None:
+        listener.stop()
+
+
+@contextlib.contextmanager
+def span(name, level=logging.DEBUG, **fields):
+    # Log how long the block took, e.g. `with span("archive", term=term):`; fields are yielded so
+    # the block can add to them (retry counts, item counts)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        log_span(name, status, (time.perf_counter() - start) * 1000, level, fields)
+
+
+def log_span(name, status, duration_ms, level=logging.DEBUG, fields=None):
+    # The record span() writes, for spans that do not fit a with block (e.g. a command timed by hooks).
+    # A "status" field set by the block overrides the ok/error status.
+    fields = fields or {}
+    details = " ".join(f"{key}={value}" for key, value in fields.items())
+    logging.log(level, "span %s %s in %.1fms %s", name, status, duration_ms, details,
+                extra={"span": name, "status": status, "duration_ms": round(duration_ms, 3), **fields})
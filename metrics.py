@@ -0,0 +1,279 @@
+import contextvars
+import logging
+import threading
+import time
+
+import discord
+from aiohttp import web
+
+from log_setup import log_span, span
+
+# In-process metrics in the Prometheus text format. instrument(bot) wraps the bot's HTTP client so
+# every REST call is counted, timed and logged as an "api" span per route, hooks the command tree and
+# prefix commands so every command is counted and timed without touching its code, picks up the
+# rate-limit waits discord.py logs, and reports gateway latency and cache sizes at scrape time.
+# start_metrics_server() serves it all on /metrics.
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_label_text(key)} {value}" for key, value in sorted(self.values.items()))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket..., sum, count]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    # Read when scraped: `callback` returns a number or a list of (labels dict, number)
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def read(self):
+        values = self.callback()
+        return values if isinstance(values, list) else [({}, values)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_label_text(tuple(sorted(labels.items())))} {value}" for labels, value in self.read())
+        return lines
+
+
+HTTP_REQUESTS = Counter("discord_http_requests_total", "REST calls by method, route and status.")
+HTTP_SECONDS = Histogram("discord_http_request_seconds", "REST call latency by method and route, including rate-limit waits.")
+RATE_LIMIT_WAIT = Counter("discord_rate_limit_wait_seconds_total", "Seconds spent waiting out 429s, by where the wait happened.")
+RATE_LIMITS = Counter("discord_rate_limits_total", "429 responses seen, by where they were handled.")
+COMMANDS = Counter("bot_commands_total", "Command invocations by command and outcome.")
+COMMAND_SECONDS = Histogram("bot_command_seconds", "Command latency by command.")
+RETRIES = Counter("bot_scheduler_retries_total", "Mutations retried by the scheduler after a 429 or 5xx.")
+# Bulk commands only queue a job and answer at once; the work itself is measured here
+JOBS = Counter("bot_jobs_total", "Background jobs by kind and outcome.")
+JOB_SECONDS = Histogram("bot_job_seconds", "Background job run time by kind, excluding time queued.")
+
+# 429 retries discord.py made inside the REST call running in this context, see measured_request
+_http_retries = contextvars.ContextVar("http_retries", default=None)
+
+METRICS = [HTTP_REQUESTS, HTTP_SECONDS, RATE_LIMIT_WAIT, RATE_LIMITS, COMMANDS, COMMAND_SECONDS, RETRIES, JOBS,
+           JOB_SECONDS]
+
+
+class MetricsLogHandler(logging.Handler):
+    # discord.py only reports the 429s it waits out itself through its log
+    def emit(self, record):
+        if record.name == "discord.http" and "rate limit" in str(record.msg) and "Retrying in" in str(record.msg):
+            delay = record.args[-1] if record.args else None
+            if isinstance(delay, (int, float)):
+                RATE_LIMITS.inc(source="discord.py")
+                RATE_LIMIT_WAIT.inc(delay, source="discord.py")
+                # Logged from inside the retrying request, so this is that request's counter
+                retries = _http_retries.get()
+                if retries is not None:
+                    retries[0] += 1
+
+
+def _command_done(command, status, started):
+    if command is None or started is None:
+        return
+    name = command.qualified_name.replace(" ", ".")
+    seconds = time.perf_counter() - started
+    COMMANDS.inc(command=name, status=status)
+    COMMAND_SECONDS.observe(seconds, command=name)
+    log_span(f"command.{name}", status, seconds * 1000, logging.INFO)
+
+
+def instrument_commands(bot):
+    # Time every slash command through the tree's check/completion/error hooks and every prefix command
+    # through the bot's before/after invoke hooks
+    tree = getattr(bot, "tree", None)
+    if tree is not None:
+        check, on_error = tree.interaction_check, tree.on_error
+
+        async def interaction_check(interaction):
+            interaction.extras["started"] = time.perf_counter()
+            return await check(interaction)
+
+        async def tree_error(interaction, error):
+            _command_done(interaction.command, "error", interaction.extras.get("started"))
+            await on_error(interaction, error)
+
+        async def on_app_command_completion(interaction, command):
+            _command_done(command, "ok", interaction.extras.get("started"))
+
+        tree.interaction_check = interaction_check
+        tree.on_error = tree_error
+        bot.add_listener(on_app_command_completion)
+    if hasattr(bot, "before_invoke"):
+        async def before_invoke(ctx):
+            ctx.started = time.perf_counter()
+
+        async def after_invoke(ctx):
+            _command_done(ctx.command, "error" if ctx.command_failed else "ok", getattr(ctx, "started", None))
+
+        bot.before_invoke(before_invoke)
+        bot.after_invoke(after_invoke)
+
+
+def _route_labels(route):
+    return {"method": route.method, "route": route.path}
+
+
+def instrument(bot):
+    # Measure every REST call the bot makes, plus commands and gateway/cache state; call once after creating the bot
+    instrument_commands(bot)
+    request = bot.http.request
+
+    async def measured_request(route, **kwargs):
+        # Every call is logged as an "api" span with its route, HTTP outcome and the 429 retries discord.py made
+        labels = _route_labels(route)
+        retries = [0]
+        token = _http_retries.set(retries)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with span("api", **labels) as fields:
+                try:
+                    return await request(route, **kwargs)
+                except discord.HTTPException as e:
+                    status = str(e.status)
+                    raise
+                except Exception:
+                    status = "error"
+                    raise
+                finally:
+                    fields["http_status"] = status
+                    fields["retries"] = retries[0]
+        finally:
+            _http_retries.reset(token)
+            HTTP_REQUESTS.inc(status=status, **labels)
+            HTTP_SECONDS.observe(time.perf_counter() - start, **labels)
+
+    bot.http.request = measured_request
+    root = logging.getLogger()
+    # One handler per process, however many clients a script instruments
+    if not any(isinstance(handler, MetricsLogHandler) for handler in root.handlers):
+        root.addHandler(MetricsLogHandler())
+    METRICS.append(Gauge("discord_gateway_latency_seconds", "Heartbeat latency of each gateway shard.",
+                         lambda: gateway_latencies(bot)))
+    METRICS.append(Gauge("discord_cache_size", "Objects held in the client cache.", lambda: cache_sizes(bot)))
+
+
+def gateway_latencies(bot):
+    # Per shard for sharded bots; NaN (not connected yet) is reported as 0
+    if isinstance(bot, discord.AutoShardedClient):
+        latencies = bot.latencies
+    else:
+        latencies = [(bot.shard_id or 0, bot.latency)]
+    return [({"shard": str(shard_id)}, latency if latency == latency else 0) for shard_id, latency in latencies]
+
+
+def cache_sizes(bot):
+    guilds = bot.guilds
+    return [
+        ({"kind": "guilds"}, len(guilds)),
+        ({"kind": "channels"}, sum(len(guild.channels) for guild in guilds)),
+        ({"kind": "roles"}, sum(len(guild.roles) for guild in guilds)),
+        ({"kind": "members"}, sum(len(guild.members) for guild in guilds)),
+        ({"kind": "users"}, len(bot.users)),
+        ({"kind": "messages"}, len(bot.cached_messages)),
+    ]
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary(top=10):
+    # Short human-readable digest for /stats
+    calls = {}
+    for key, value in HTTP_REQUESTS.values.items():
+        labels = dict(key)
+        route = f"{labels['method']} {labels['route']}"
+        calls[route] = calls.get(route, 0) + value
+    lines = [f"REST calls: {sum(calls.values())}"]
+    lines.extend(f"  {count:>6}  {route}" for route, count in sorted(calls.items(), key=lambda item: -item[1])[:top])
+    lines.append(f"429s: {sum(RATE_LIMITS.values.values())}, rate-limit wait: {sum(RATE_LIMIT_WAIT.values.values()):.1f}s, "
+                 f"scheduler retries: {sum(RETRIES.values.values())}")
+    for key, series in sorted(COMMAND_SECONDS.values.items()):
+        lines.append(f"/{dict(key)['command']}: {series[-1]} runs, avg {series[-2] / series[-1]:.2f}s")
+    for key, series in sorted(JOB_SECONDS.values.items()):
+        kind = dict(key)["kind"]
+        failed = sum(count for labels, count in JOBS.values.items() if dict(labels) == {"kind": kind, "status": "failed"})
+        lines.append(f"{kind} jobs: {series[-1]} runs ({failed} failed), avg {series[-2] / series[-1]:.2f}s")
+    for metric in METRICS:
+        if isinstance(metric, Gauge):
+            for labels, value in metric.read():
+                suffix = f" ({', '.join(str(value) for value in labels.values())})" if labels else ""
+                lines.append(f"{metric.name}{suffix}: {value:g}")
+    return "\n".join(lines)
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    # Serve /metrics from inside the bot process; returns the runner so it can be cleaned up
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
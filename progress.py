@@ -0,0 +1,85 @@
+import io
+import logging
+import time
+
+import discord
+
+# One progress message per command, edited in place at a throttled rate instead of one chat message
+# per channel. Per-item details go to the log and are attached as a summary file when the command
+# finishes, so status reporting costs a handful of API calls however many items are processed.
+
+PROGRESS_INTERVAL = 2.0
+PROGRESS_EVERY = 50
+# Discord's message length limit
+MESSAGE_LIMIT = 2000
+
+
+class ProgressReporter:
+    # `send` posts the progress message and returns it, e.g. ctx.send or
+    # functools.partial(interaction.followup.send, ephemeral=True, wait=True)
+    def __init__(self, send, label="Working", total=None, interval=PROGRESS_INTERVAL, every=PROGRESS_EVERY):
+        self.send = send
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.every = every
+        self.done = 0
+        self.details = []
+        self.message = None
+        self._last_edit = 0.0
+        self._last_done = 0
+        self._editing = False
+
+    def status(self):
+        if self.total is not None:
+            return f"{self.label}: {self.done}/{self.total}"
+        return f"{self.label}: {self.done}"
+
+    async def start(self, text=None):
+        self.message = await self.send(text or f"{self.status()}...")
+        self._last_edit = time.monotonic()
+        return self.message
+
+    def detail(self, line, level=logging.INFO):
+        # Record a line for the log and the final summary without touching Discord
+        self.details.append(line)
+        logging.log(level, line)
+
+    async def advance(self, detail=None, count=1):
+        self.done += count
+        if detail:
+            self.detail(detail)
+        due = (time.monotonic() - self._last_edit >= self.interval
+               or (self.every and self.done - self._last_done >= self.every))
+        if due:
+            await self.update(self.status())
+
+    async def update(self, text):
+        # Edits already in flight are not queued up behind each other; the next due update catches up
+        if self.message is None or self._editing:
+            return
+        self._editing = True
+        try:
+            await self.message.edit(content=text[:MESSAGE_LIMIT])
+        except discord.HTTPException as e:
+            logging.warning("Failed to update progress message: %s", e)
+        finally:
+            self._editing = False
+            self._last_edit = time.monotonic()
+            self._last_done = self.done
+
+    async def finish(self, text, filename="summary.txt"):
+        # Final edit, with every recorded detail attached as a text file
+        content = text[:MESSAGE_LIMIT]
+        attachments = []
+        if self.details:
+            summary = "\n".join(self.details).encode("utf-8")
+            attachments.append(discord.File(io.BytesIO(summary), filename=filename))
+        try:
+            if self.message is None:
+                self.message = await self.send(content, files=attachments) if attachments else await self.send(content)
+            else:
+                await self.message.edit(content=content, attachments=attachments)
+        except discord.HTTPException as e:
+            logging.warning("Failed to send progress summary: %s", e)
+        return self.message
@@ -3,65 +3,83 @@ import asyncio
 import logging
 import os
 from datetime import datetime
-import re
+
+from client_profiles import client_options
+from guild_index import fetch_guild_index
+from log_setup import setup_logging
+from metrics import instrument
+from scheduler import MutationScheduler
+from workflows import for_each_guild, update_labtech_rw_access
 
 # Setup logging
 log_directory = "logs"
 os.makedirs(log_directory, exist_ok=True)
 log_filename = os.path.join(log_directory, f"grant_rw_summer2025_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log")
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s]: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Log format: see log_setup.setup_logging
+LOG_JSON = False
+setup_logging(log_filename, level=logging.INFO, json_lines=LOG_JSON)
 
 # Load token from Bot Key.txt in the same directory
 with open("Bot Key.txt", "r", encoding="utf-8") as key_file:
     TOKEN = key_file.readline().strip()
 
-# Regex pattern for current semester channels
-pattern = re.compile(r'^[a-zA-Z]+-\d{3}-summer-2025$', re.IGNORECASE)
+# Current semester channels
+TERM = "summer"
+YEAR = 2025
 
-intents = discord.Intents.default()
-intents.guilds = True
-intents.guild_messages = True
-intents.message_content = True
+# Maximum number of permission edits kept in flight across all guilds, and guilds updated at once
+MAX_CONCURRENCY = 8
+GUILD_CONCURRENCY = 4
+# Shared by every guild (and shard), so the concurrency limit and 429 backoffs are process-wide
+scheduler = MutationScheduler(concurrency=MAX_CONCURRENCY)
 
-client = discord.Client(intents=intents)
+# REST-only mode logs in over HTTP and fetches just the channels and roles it needs instead of
+# connecting to the gateway and waiting for the whole cache; set False to run through the gateway
+REST_ONLY = True
+# Guild IDs to update in REST-only mode; empty means every guild the bot is in
+GUILD_IDS = []
 
-@client.event
-async def on_ready():
-    logging.info(f"Logged in as {client.user}")
-    for guild in client.guilds:
-        await update_labtech_rw_access(guild)
-    await client.close()
+async def run_rest_only():
+    async with discord.Client(intents=discord.Intents.none()) as rest_client:
+        instrument(rest_client)
+        await rest_client.login(TOKEN)
+        guild_ids = GUILD_IDS or [guild.id async for guild in rest_client.fetch_guilds(limit=None)]
+        indexes = await asyncio.gather(*(fetch_guild_index(rest_client, guild_id) for guild_id in guild_ids))
+        logging.info(f"Fetched {len(indexes)} guilds over REST")
+        await for_each_guild([index.guild for index in indexes], update_labtech_rw_access, TERM, YEAR,
+                             scheduler=scheduler, guild_concurrency=GUILD_CONCURRENCY,
+                             indexes={index.guild.id: index for index in indexes})
 
-async def update_labtech_rw_access(guild: discord.Guild):
-    logging.info(f"Updating Summer 2025 RW access in guild: {guild.name}")
-    lab_tech_role = discord.utils.get(guild.roles, name="Lab Tech")
+# Cache profile: see client_profiles
+CLIENT_PROFILE = "lean"
 
-    if not lab_tech_role:
-        logging.error("Lab Tech role not found in the guild.")
-        return
+# Sharded so large deployments connect in parallel; each shard's guilds are updated as soon as that
+# shard is ready instead of waiting for every shard
+client = discord.AutoShardedClient(**client_options(CLIENT_PROFILE))
+instrument(client)
+started_shards = set()
+finished_shards = set()
 
-    updated_channels = []
-    for channel in guild.text_channels:
-        if pattern.match(channel.name):
-            try:
-                await channel.set_permissions(lab_tech_role, overwrite=discord.PermissionOverwrite(
-                    read_messages=True,
-                    send_messages=True,
-                    read_message_history=True
-                ))
-                updated_channels.append(channel.name)
-                logging.info(f"Granted RW access to Lab Tech for '{channel.name}'")
-            except Exception as e:
-                logging.error(f"Failed to update '{channel.name}': {e}")
+@client.event
+async def on_shard_ready(shard_id):
+    # READY can repeat after a reconnect; each shard's guilds are only updated once
+    if shard_id in started_shards:
+        return
+    started_shards.add(shard_id)
+    guilds = [guild for guild in client.guilds if guild.shard_id == shard_id]
+    logging.info(f"Shard {shard_id} ready with {len(guilds)} guilds")
+    await for_each_guild(guilds, update_labtech_rw_access, TERM, YEAR, scheduler=scheduler,
+                         guild_concurrency=GUILD_CONCURRENCY)
+    finished_shards.add(shard_id)
+    # The client closes once the last shard's guilds are done
+    if len(finished_shards) == client.shard_count:
+        await client.close()
 
-    if updated_channels:
-        logging.info(f"Updated {len(updated_channels)} channels: {', '.join(updated_channels)}")
-    else:
-        logging.info("No matching channels found.")
+@client.event
+async def on_ready():
+    logging.info(f"Logged in as {client.user} on {client.shard_count} shards")
 
-client.run(TOKEN)
+if REST_ONLY:
+    asyncio.run(run_rest_only())
+else:
+    client.run(TOKEN)
@@ -1,37 +1,40 @@
+import argparse
+import asyncio
 import os
 
 import discord
 from discord.ext import commands
 import logging
 
+from catalog import CATALOG_FILE, CatalogError, load_catalog
+from client_profiles import client_options
+from guild_index import fetch_guild_index
+from log_setup import setup_logging
+from metrics import instrument
+from progress import MESSAGE_LIMIT
+from scheduler import MutationScheduler
+from workflows import create_course_roles
+
 # Setup logging
 log_filename = "create_roles.log"
 log_directory = "logs"
 os.makedirs(log_directory, exist_ok=True)
 
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s]: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Log format: see log_setup.setup_logging
+LOG_JSON = False
+setup_logging(log_filename, level=logging.DEBUG, json_lines=LOG_JSON)
 
 logging.info("Role creation script starting up.")
 
-# Enable intents
-intents = discord.Intents.default()
-intents.message_content = True  # Required for command handling
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Predefined categories and their respective courses
-categories = {
-    "CPT": [113, 168, 170, 187, 189, 209, 230, 231, 234, 236, 237, 239, 257, 264, 267, 270, 273, 275, 280, 283, 289],
-    "IST": [110, 190, 191, 198, 201, 202, 203, 220, 226, 239, 257, 258, 266, 267, 272, 278, 291, 292, 293, 294, 295, 299],
-    "SPC": [205, 208, 209],
-    "SOC": [101],
-    "HSS": [105],
-    "HIS": [122]
-}
+# Cache profile: see client_profiles
+CLIENT_PROFILE = "lean"
+bot = commands.Bot(command_prefix='!', **client_options(CLIENT_PROFILE, prefix_commands=True))
+# Every command and REST call is counted, timed and logged as a span (see metrics.py)
+instrument(bot)
+
+# Maximum number of role creations kept in flight, across every running command
+MAX_CONCURRENCY = 8
+scheduler = MutationScheduler(concurrency=MAX_CONCURRENCY)
 
 @bot.event
 async def on_ready():
@@ -51,28 +54,43 @@ async def create_roles(ctx):
         logging.error("Command invoked outside of a guild.")
         return
 
-    created_roles = []
-    for category, courses in categories.items():
-        for course in courses:
-            role_name = f"{category}-{course}"
-            existing_role = discord.utils.get(guild.roles, name=role_name)
-            if not existing_role:
-                try:
-                    await guild.create_role(name=role_name)
-                    created_roles.append(role_name)
-                    logging.info(f"Role '{role_name}' created successfully.")
-                except Exception as e:
-                    logging.error(f"Failed to create role '{role_name}': {e}")
-            else:
-                logging.info(f"Role '{role_name}' already exists. Skipping.")
+    try:
+        catalog = load_catalog(CATALOG_FILE)
+    except (OSError, CatalogError) as e:
+        await ctx.send(f"Could not read the course catalog: {e}")
+        logging.error("Could not read the course catalog '%s': %s", CATALOG_FILE, e)
+        return
+
+    created_roles = await create_course_roles(guild, catalog, scheduler=scheduler)
 
     if created_roles:
-        await ctx.send(f"Created roles: {', '.join(created_roles)}")
+        await ctx.send(f"Created {len(created_roles)} roles: {', '.join(created_roles)}"[:MESSAGE_LIMIT])
     else:
         await ctx.send("No new roles were created. All roles already exist.")
 
-# Debugging Command Prefix
-print(f"Command Prefix: {bot.command_prefix}")
-logging.info(f"Command Prefix: {bot.command_prefix}")
+async def create_roles_rest_only(guild_ids):
+    # One-shot provisioning over HTTP alone: no gateway connection or cache, just the guild's roles and channels
+    catalog = load_catalog(CATALOG_FILE)
+    async with discord.Client(intents=discord.Intents.none()) as rest_client:
+        instrument(rest_client)
+        await rest_client.login(TOKEN)
+        for guild_id in guild_ids:
+            index = await fetch_guild_index(rest_client, guild_id)
+            created_roles = await create_course_roles(index.guild, catalog, index=index, scheduler=scheduler)
+            print(f"{index.guild.name}: created {len(created_roles)} roles")
+
+TOKEN = '{API_Key}'
+
+parser = argparse.ArgumentParser(description="Create course roles from the course catalog.")
+parser.add_argument("--rest", type=int, nargs="+", metavar="GUILD_ID",
+                    help="Provision these guilds over REST and exit instead of running the !create_roles bot")
+args = parser.parse_args()
+
+if args.rest:
+    asyncio.run(create_roles_rest_only(args.rest))
+else:
+    # Debugging Command Prefix
+    print(f"Command Prefix: {bot.command_prefix}")
+    logging.info(f"Command Prefix: {bot.command_prefix}")
 
-bot.run('{API_Key}')
\ No newline at end of file
+    bot.run(TOKEN)
\ No newline at end of file
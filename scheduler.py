@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+
+import discord
+
+from log_setup import span
+from metrics import RATE_LIMIT_WAIT, RATE_LIMITS, RETRIES
+
+# Defaults for bulk guild operations; every bot can override them when building its scheduler
+MAX_CONCURRENCY = 8
+BUCKET_CONCURRENCY = 1
+GUILD_BUCKET_CONCURRENCY = 4
+# Guilds processed at once by workflows.for_each_guild
+GUILD_CONCURRENCY = 4
+MAX_RETRIES = 5
+BASE_BACKOFF = 1.0
+
+
+def channel_bucket(channel):
+    # Edits, overwrites and history on one channel share that channel's route bucket
+    return f"channel:{channel.id}"
+
+
+def guild_bucket(guild, route):
+    # Guild-wide routes such as role or channel creation share a single bucket per guild
+    return f"guild:{guild.id}:{route}"
+
+
+def _retry_after(exc):
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        retry_after = headers.get("Retry-After")
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        return BASE_BACKOFF
+
+
+def _is_global(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    return str(headers.get("X-RateLimit-Global", "")).lower() == "true"
+
+
+class MutationScheduler:
+    # Runs Discord mutations concurrently up to `concurrency`, with at most `bucket_concurrency`
+    # in flight per channel bucket and `guild_bucket_concurrency` per guild-wide bucket.
+    # A 429 pauses its bucket (or everything, if global) for the advertised retry_after;
+    # 5xx errors are retried with exponential backoff. A bot keeps one scheduler for the whole
+    # process so these limits and backoffs hold across every job and guild; each workflow run
+    # submits through a batch() of its own and waits for just its own mutations.
+    def __init__(self, concurrency=MAX_CONCURRENCY, bucket_concurrency=BUCKET_CONCURRENCY,
+                 guild_bucket_concurrency=GUILD_BUCKET_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.concurrency = concurrency
+        self.bucket_concurrency = bucket_concurrency
+        self.guild_bucket_concurrency = guild_bucket_concurrency
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._buckets = {}
+        self._blocked_until = {}
+        self._global_blocked_until = 0.0
+
+    def _bucket_semaphore(self, bucket):
+        if bucket not in self._buckets:
+            limit = self.guild_bucket_concurrency if bucket.startswith("guild:") else self.bucket_concurrency
+            self._buckets[bucket] = asyncio.Semaphore(limit)
+        return self._buckets[bucket]
+
+    async def _wait_for_bucket(self, bucket):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = max(self._blocked_until.get(bucket, 0.0), self._global_blocked_until) - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _run(self, bucket, func, args, kwargs):
+        # Every mutation is logged as a "mutation" span with its bucket, duration (including backoff) and retries;
+        # the REST calls it makes get their own "api" spans from metrics.instrument()
+        with span("mutation", bucket=bucket, call=getattr(func, "__qualname__", repr(func)), retries=0) as fields:
+            return await self._attempt(bucket, func, args, kwargs, fields)
+
+    async def _attempt(self, bucket, func, args, kwargs, fields):
+        loop = asyncio.get_running_loop()
+        async with self._bucket_semaphore(bucket):
+            attempt = 0
+            while True:
+                await self._wait_for_bucket(bucket)
+                try:
+                    async with self._semaphore:
+                        return await func(*args, **kwargs)
+                # RateLimited is not an HTTPException: discord.py raises it instead of waiting when a
+                # rate limit exceeds the client's max_ratelimit_timeout
+                except (discord.HTTPException, discord.RateLimited) as e:
+                    status = getattr(e, "status", None)
+                    if isinstance(e, discord.RateLimited):
+                        status = 429
+                    if attempt >= self.max_retries or not (status == 429 or (status or 0) >= 500):
+                        raise
+                    attempt += 1
+                    fields["retries"] = attempt
+                    RETRIES.inc()
+                    if status == 429:
+                        delay = _retry_after(e)
+                        until = loop.time() + delay
+                        if _is_global(e):
+                            self._global_blocked_until = max(self._global_blocked_until, until)
+                        else:
+                            self._blocked_until[bucket] = max(self._blocked_until.get(bucket, 0.0), until)
+                        RATE_LIMITS.inc(source="scheduler")
+                        RATE_LIMIT_WAIT.inc(delay, source="scheduler")
+                        logging.warning("Rate limited on %s; backing off %.2fs (attempt %d).", bucket, delay, attempt)
+                    else:
+                        delay = BASE_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2)
+                        logging.warning("Server error %s on %s; retrying in %.2fs (attempt %d).", status, bucket, delay, attempt)
+                        await asyncio.sleep(delay)
+
+    def batch(self):
+        return MutationBatch(self)
+
+
+class MutationBatch:
+    # The mutations one workflow run submits to a (usually shared) scheduler
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._tasks = []
+
+    def submit(self, bucket, func, *args, **kwargs):
+        # Schedule `await func(*args, **kwargs)` under `bucket`; returns the asyncio.Task
+        task = asyncio.ensure_future(self.scheduler._run(bucket, func, args, kwargs))
+        self._tasks.append(task)
+        return task
+
+    async def drain(self, progress=None):
+        # Wait for everything submitted so far; results (or exceptions) come back in submission order.
+        # A ProgressReporter, if given, is advanced as each task finishes.
+        tasks, self._tasks = self._tasks, []
+        if progress is not None:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    await finished
+                except Exception:
+                    pass
+                await progress.advance()
+        return await asyncio.gather(*tasks, return_exceptions=True)
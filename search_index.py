@@ -0,0 +1,184 @@
+import argparse
+import logging
+import os
+import sqlite3
+
+from channel_names import parse_channel_name
+from exporter import EXPORT_ROOT, iter_segment_records, load_json, parse_segment_name
+
+# SQLite FTS5 index over exported archives. index_exports() walks EXPORT_ROOT, ingests only the
+# segment bytes it has not seen yet (tracked per segment file) in large batched transactions, and
+# search() answers ranked full-text queries filtered by guild, subject, course, term, year, channel
+# or author.
+#
+#   python search_index.py                      # ingest new segments
+#   python search_index.py --query "pointer arithmetic" --subject cpt
+
+SEARCH_DB = os.path.join(EXPORT_ROOT, "search.sqlite")
+BATCH_ROWS = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    channel_id INTEGER,
+    channel TEXT,
+    subject TEXT,
+    course TEXT,
+    term TEXT,
+    year INTEGER,
+    author_id INTEGER,
+    author TEXT,
+    created_at TEXT,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_course ON messages (subject, course, term, year);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, author, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, author) VALUES (new.id, new.content, new.author);
+END;
+CREATE TABLE IF NOT EXISTS ingested (path TEXT PRIMARY KEY, offset INTEGER NOT NULL);
+"""
+
+def connect(db_path=SEARCH_DB):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def _channel_segments(directory):
+    # (path, codec, end offset) for every segment; the segment being written is cut at its last complete frame
+    checkpoint = load_json(os.path.join(directory, "checkpoint.json"))
+    if not checkpoint:
+        return []
+    segments = []
+    for filename in sorted(os.listdir(directory)):
+        parsed = parse_segment_name(filename)
+        if not parsed:
+            continue
+        number, codec = parsed
+        path = os.path.join(directory, filename)
+        if number == checkpoint["segment"]:
+            end = checkpoint["offset"]
+        elif number < checkpoint["segment"]:
+            end = os.path.getsize(path)
+        else:
+            continue
+        segments.append((path, codec, end))
+    return segments
+
+
+def index_exports(root=EXPORT_ROOT, db_path=SEARCH_DB):
+    # Ingest every segment byte range not indexed yet; returns the number of new messages
+    db = connect(db_path)
+    added = 0
+    try:
+        for guild_entry in os.scandir(root):
+            if not guild_entry.is_dir() or not guild_entry.name.isdigit():
+                continue
+            for channel_entry in os.scandir(guild_entry.path):
+                if channel_entry.is_dir():
+                    added += _index_channel(db, channel_entry.path)
+    finally:
+        db.close()
+    logging.info("Indexed %d new messages from '%s'.", added, root)
+    return added
+
+
+def _index_channel(db, directory):
+    channel = load_json(os.path.join(directory, "channel.json"), {})
+    record = parse_channel_name(channel.get("name", ""))
+    subject, course, term, year = record if record else (None, None, None, None)
+    added = 0
+    for path, codec, end in _channel_segments(directory):
+        row = db.execute("SELECT offset FROM ingested WHERE path = ?", (path,)).fetchone()
+        start = row[0] if row else 0
+        if end <= start:
+            continue
+        batch = []
+        for message in iter_segment_records(path, codec, start, end):
+            batch.append((message["id"], message["guild_id"], message["channel_id"], channel.get("name"), subject, course,
+                          term, year, message["author_id"], message["author"], message["created_at"], message["content"]))
+            if len(batch) >= BATCH_ROWS:
+                added += _insert(db, batch)
+                batch = []
+        # The last batch and the new offset commit together so a crash never skips a range; rows from a
+        # repeated range are ignored by their message ID
+        with db:
+            added += _insert(db, batch, commit=False)
+            db.execute("INSERT OR REPLACE INTO ingested (path, offset) VALUES (?, ?)", (path, end))
+    return added
+
+
+def _insert(db, batch, commit=True):
+    if not batch:
+        return 0
+    cursor = db.executemany("INSERT OR IGNORE INTO messages (id, guild_id, channel_id, channel, subject, course, term, year, "
+                            "author_id, author, created_at, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    if commit:
+        db.commit()
+    return cursor.rowcount
+
+
+def fts_query(text):
+    # Quote every term so user input is never parsed as FTS5 syntax
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+def search(text, guild_id=None, subject=None, course=None, term=None, year=None, channel_id=None, author=None,
+           channel_ids=None, limit=10, db_path=SEARCH_DB):
+    # Best matches first: dicts with message/channel/guild IDs, channel name, author, timestamp and a snippet.
+    # `channel_ids`, if given, restricts the hits to those channels (e.g. the ones the searcher can read).
+    if not text.split() or not os.path.exists(db_path) or (channel_ids is not None and not channel_ids):
+        return []
+    filters = {"m.guild_id": guild_id, "m.subject": subject.lower() if subject else None, "m.course": course,
+               "m.term": term.lower() if term else None, "m.year": year, "m.channel_id": channel_id, "m.author": author}
+    sql = ("SELECT m.id, m.guild_id, m.channel_id, m.channel, m.author, m.created_at, "
+           "snippet(messages_fts, 0, '**', '**', '...', 16) "
+           "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ?")
+    params = [fts_query(text)]
+    for column, value in filters.items():
+        if value is not None:
+            sql += f" AND {column} = ?"
+            params.append(value)
+    if channel_ids is not None:
+        channel_ids = list(channel_ids)
+        sql += f" AND m.channel_id IN ({', '.join('?' * len(channel_ids))})"
+        params.extend(channel_ids)
+    sql += " ORDER BY bm25(messages_fts) LIMIT ?"
+    params.append(limit)
+    db = sqlite3.connect(db_path)
+    try:
+        rows = db.execute(sql, params).fetchall()
+    finally:
+        db.close()
+    keys = ["id", "guild_id", "channel_id", "channel", "author", "created_at", "snippet"]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index exported archives and search them.")
+    parser.add_argument("--root", default=EXPORT_ROOT, help="Export directory to index")
+    parser.add_argument("--db", default=SEARCH_DB, help="SQLite database path")
+    parser.add_argument("--query", help="Search instead of indexing")
+    parser.add_argument("--subject")
+    parser.add_argument("--course")
+    parser.add_argument("--term")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.query:
+        for hit in search(args.query, subject=args.subject, course=args.course, term=args.term, year=args.year,
+                          limit=args.limit, db_path=args.db):
+            print(f"{hit['created_at']} #{hit['channel']} {hit['author']}: {hit['snippet']}")
+    else:
+        print(f"Indexed {index_exports(args.root, args.db)} new messages.")
+
+
+if __name__ == "__main__":
+    main()
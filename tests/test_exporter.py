@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+import pytest
+
+import exporter
+from archive_reader import ChannelArchive
+from exporter import SegmentWriter, iter_segment_records, load_json, segment_path
+
+
+def write(directory, ids, finish=True):
+    async def run():
+        writer = SegmentWriter(directory, codec="gzip", frame_messages=2, segment_messages=4)
+        for message_id in ids:
+            await writer.add({"id": message_id})
+        if finish:
+            await writer.finish()
+    asyncio.run(run())
+
+
+def segment_ids(directory, segment):
+    return [record["id"] for record in iter_segment_records(segment_path(directory, segment, "gzip"), "gzip")]
+
+
+def test_rotation_crash_resumes_without_losing_messages(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    save_json = exporter.save_json
+    saves = []
+
+    def crash_on_third_frame(path, data):
+        saves.append(path)
+        if len(saves) == 3:
+            raise OSError("crash")
+        save_json(path, data)
+
+    # Frames 1 and 2 fill segment 0; frame 3 is written to segment 1 but never checkpointed
+    monkeypatch.setattr(exporter, "save_json", crash_on_third_frame)
+    with pytest.raises(OSError):
+        write(directory, [1, 2, 3, 4, 5, 6])
+    monkeypatch.setattr(exporter, "save_json", save_json)
+
+    write(directory, [5, 6, 7, 8])
+
+    assert segment_ids(directory, 0) == [1, 2, 3, 4]
+    assert segment_ids(directory, 1) == [5, 6, 7, 8]
+    checkpoint = load_json(os.path.join(directory, "checkpoint.json"))
+    assert checkpoint["offset"] == os.path.getsize(segment_path(directory, 1, "gzip"))
+    assert checkpoint["total"] == 8
+    with ChannelArchive(directory) as archive:
+        assert [archive.get(message_id)["id"] for message_id in range(1, 9)] == list(range(1, 9))
+
+
+def test_partial_frame_is_truncated_on_resume(tmp_path):
+    directory = str(tmp_path)
+    # Interrupted while writing the second frame: only its first bytes reached the segment
+    write(directory, [1, 2], finish=False)
+    with open(segment_path(directory, 0, "gzip"), "ab") as f:
+        f.write(b"half a frame")
+
+    write(directory, [3, 4, 5, 6])
+
+    assert segment_ids(directory, 0) == [1, 2, 3, 4]
+    assert segment_ids(directory, 1) == [5, 6]
@@ -0,0 +1,19 @@
+from fake_discord import FakeGuild
+from guild_index import GuildIndex
+
+
+def test_duplicate_names_resolve_to_the_first_object():
+    guild = FakeGuild()
+    first_role, second_role = guild.add_role("CPT-113"), guild.add_role("CPT-113")
+    first_channel, second_channel = guild.add_text_channel("cpt-113-spring-2025"), guild.add_text_channel("cpt-113-spring-2025")
+    index = GuildIndex(guild)
+
+    assert index.role("CPT-113") is first_role
+    assert index.course_roles["cpt-113"] is first_role
+    assert index.channel("cpt-113-spring-2025") is first_channel
+
+    # Renaming the first channel away exposes the next one under the old name
+    first_channel.name = "cpt-113-fall-2025"
+    index.add_channel(first_channel)
+    assert index.channel("cpt-113-spring-2025") is second_channel
+    assert index.channel("cpt-113-fall-2025") is first_channel
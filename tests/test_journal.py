@@ -0,0 +1,44 @@
+import os
+
+from journal import JobJournal
+
+
+def test_failed_steps_are_retried_after_an_interruption(tmp_path):
+    path = str(tmp_path / "job.jsonl")
+    journal = JobJournal(path)
+    journal.plan({"move:1": None, "move:2": None, "move:3": None})
+    journal.done("move:1", 10)
+    journal.failed("move:2", "403 Forbidden")
+    assert journal.pending() == ["move:3"]
+
+    # Interrupted before move:3: the done step is replayed, the failed one is tried again
+    resumed = JobJournal(path)
+    assert resumed.is_done("move:1") and resumed.result("move:1") == 10
+    assert resumed.pending() == ["move:2", "move:3"]
+
+
+def test_journal_completes_once_every_step_is_done_or_failed(tmp_path):
+    path = str(tmp_path / "job.jsonl")
+    journal = JobJournal(path)
+    journal.plan({"create:a": None, "create:b": None})
+    journal.done("create:a")
+    journal.failed("create:b", "403 Forbidden")
+    assert not journal.pending()
+    journal.complete()
+
+    assert not os.path.exists(path) and os.path.exists(f"{path}.completed")
+    assert not JobJournal(path).resumed
+
+
+def test_torn_last_entry_is_dropped(tmp_path):
+    path = str(tmp_path / "job.jsonl")
+    journal = JobJournal(path)
+    journal.plan({"move:1": None})
+    journal.done("move:1")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "done", "st')
+
+    resumed = JobJournal(path)
+    assert resumed.is_done("move:1")
+    resumed.plan({"move:2": None})
+    assert JobJournal(path).pending() == ["move:2"]
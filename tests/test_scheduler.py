@@ -0,0 +1,28 @@
+import asyncio
+
+from scheduler import MutationScheduler
+
+
+def test_batches_share_the_scheduler_limits_but_drain_separately():
+    in_flight = []
+    peak = []
+
+    async def mutation(value):
+        in_flight.append(value)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(value)
+        return value
+
+    async def run():
+        scheduler = MutationScheduler(concurrency=3)
+        first, second = scheduler.batch(), scheduler.batch()
+        for n in range(6):
+            first.submit(f"channel:{n}", mutation, ("first", n))
+            second.submit(f"channel:{n + 10}", mutation, ("second", n))
+        return await first.drain(), await second.drain()
+
+    first, second = asyncio.run(run())
+    assert first == [("first", n) for n in range(6)]
+    assert second == [("second", n) for n in range(6)]
+    assert max(peak) == 3
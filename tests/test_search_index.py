@@ -0,0 +1,29 @@
+import asyncio
+import os
+
+from exporter import SegmentWriter, channel_directory, save_json
+from search_index import index_exports, search
+
+
+def export(root, guild_id, channel_id, name, contents):
+    directory = channel_directory(root, guild_id, channel_id)
+
+    async def run():
+        writer = SegmentWriter(directory, codec="gzip")
+        for n, content in enumerate(contents):
+            await writer.add({"id": channel_id * 100 + n, "guild_id": guild_id, "channel_id": channel_id,
+                              "author_id": 1, "author": "student", "created_at": "2025-01-01T00:00:00", "content": content})
+        await writer.finish()
+    asyncio.run(run())
+    save_json(os.path.join(directory, "channel.json"), {"id": channel_id, "name": name, "guild_id": guild_id})
+
+
+def test_search_is_limited_to_the_given_channels(tmp_path):
+    root, db_path = str(tmp_path / "exports"), str(tmp_path / "search.sqlite3")
+    export(root, 1, 10, "cpt-113-spring-2025", ["pointer arithmetic homework"])
+    export(root, 1, 20, "ist-166-spring-2025", ["pointer to the syllabus"])
+    assert index_exports(root, db_path) == 2
+
+    assert {hit["channel_id"] for hit in search("pointer", guild_id=1, db_path=db_path)} == {10, 20}
+    assert [hit["channel_id"] for hit in search("pointer", guild_id=1, channel_ids=[20], db_path=db_path)] == [20]
+    assert search("pointer", guild_id=1, channel_ids=[], db_path=db_path) == []
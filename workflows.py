@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import os
+from collections import namedtuple
+
+import discord
+
+from attachments import AttachmentDownloader
+from catalog import course_role_names
+from channel_names import rollover
+from channel_plan import ChannelPlan, apply_plan, merge_overwrites, normalize_channel_name, overwrites_equal, plan_bucket
+from exporter import EXPORT_CONCURRENCY, EXPORT_ROOT, export_channels
+from guild_index import GuildIndex
+from journal import JOURNAL_ROOT, JobJournal
+from log_setup import span
+from scheduler import GUILD_CONCURRENCY, MAX_CONCURRENCY, MutationScheduler, channel_bucket, guild_bucket
+
+# The guild-level work behind the bot commands, kept free of interaction/ctx handling so it can be
+# driven by any of the bots, by one-shot scripts or by the offline benchmark against a fake guild.
+
+
+class WorkflowError(Exception):
+    # A problem the invoking user should be told about (e.g. a required role is missing)
+    pass
+
+
+def _note(progress, line, level=logging.INFO):
+    # Per-item outcome: into the progress summary when there is one, otherwise just the log
+    if progress is not None:
+        progress.detail(line, level)
+    else:
+        logging.log(level, line)
+
+
+def _batch(scheduler, concurrency):
+    # Mutations of one workflow run. A shared `scheduler` (one per bot process) applies its limits and backoff
+    # across every concurrent job and guild; without one this run gets a scheduler of its own.
+    return (scheduler or MutationScheduler(concurrency=concurrency)).batch()
+
+
+async def for_each_guild(guilds, workflow, *args, guild_concurrency=GUILD_CONCURRENCY, indexes=None, **kwargs):
+    # Run `workflow(guild, *args, **kwargs)` for many guilds at once, at most `guild_concurrency` at a time.
+    # Returns {guild: result, or the exception that workflow raised}; one guild failing does not stop the others.
+    # `indexes` ({guild id: GuildIndex}, e.g. built over REST) hands each workflow its prebuilt index.
+    semaphore = asyncio.Semaphore(guild_concurrency)
+
+    async def run(guild):
+        guild_kwargs = kwargs if indexes is None else {**kwargs, "index": indexes[guild.id]}
+        async with semaphore:
+            with span(workflow.__name__, level=logging.INFO, guild=guild.id):
+                return await workflow(guild, *args, **guild_kwargs)
+
+    guilds = list(guilds)
+    results = await asyncio.gather(*(run(guild) for guild in guilds), return_exceptions=True)
+    for guild, result in zip(guilds, results):
+        if isinstance(result, Exception):
+            logging.error("%s failed in guild '%s': %s", workflow.__name__, guild.name, result)
+    return dict(zip(guilds, results))
+
+
+async def archive_term(guild: discord.Guild, term, year, concurrency=MAX_CONCURRENCY, export_root=None, progress=None,
+                       journal_root=JOURNAL_ROOT, inherit_permissions=True, scheduler=None):
+    # Move every channel of `term` `year` into the "{Term} {Year} Archive" category as read-only.
+    # With `export_root`, each channel's history gets a final incremental export right before it is moved.
+    # Moves are journaled under `journal_root`, so re-running after an interruption skips channels already moved
+    # (as long as they are still in the archive category).
+    # With `inherit_permissions` moved channels drop their own overwrites and sync to the archive category,
+    # so the whole archived term's permissions live on (and can be changed through) the category alone.
+    term = term.lower()
+    archive_category_name = f"{term.capitalize()} {year} Archive"
+    index = GuildIndex(guild)
+    journal = JobJournal.open(guild, f"archive-{term}-{year}", journal_root)
+
+    # Fetch the Verified role
+    verified_role = index.role("Verified")
+
+    if not verified_role:
+        logging.error("Verified role not found.")
+        raise WorkflowError("The 'Verified' role does not exist. Please create it first.")
+
+    # Read-only archive permissions, shared by the category and every moved channel
+    archive_overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False),
+        verified_role: discord.PermissionOverwrite(read_messages=True, send_messages=False, read_message_history=True)
+    }
+
+    # Create the archive category if it doesn't exist
+    archive_category = index.category(archive_category_name)
+    if not archive_category:
+        archive_category = await index.create_category(archive_category_name, overwrites=archive_overwrites)
+        logging.info("Archive category '%s' created.", archive_category_name)
+    elif inherit_permissions:
+        # Channels are about to inherit from the category, so it must carry the archive permissions itself;
+        # overwrites staff added to the category are kept
+        desired = merge_overwrites(archive_category.overwrites, archive_overwrites)
+        if not overwrites_equal(archive_category.overwrites, desired):
+            archive_category = await archive_category.edit(overwrites=desired)
+            logging.info("Archive category '%s' permissions updated.", archive_category_name)
+
+    # Plan the end state of every matching channel, then apply one edit per channel that differs
+    channels = index.term(term, year)
+    journal.plan({f"move:{channel.id}": {"name": channel.name} for channel in channels})
+    moved_channels = []
+    # A move the journal records is only skipped while the channel is still in the archive category
+    done = {channel.id for channel in channels
+            if journal.is_done(f"move:{channel.id}") and channel.category_id == archive_category.id}
+    for channel in channels:
+        if channel.id in done:
+            moved_channels.append(channel.name)
+            _note(progress, f"Channel '{channel.name}' was archived by the interrupted run. Skipping.")
+    channels = [channel for channel in channels if channel.id not in done]
+    if export_root:
+        exported = await export_channels(channels, root=export_root)
+        # Leave channels whose export failed where they are rather than archive them with history missing
+        for channel, count in exported.items():
+            if count is None:
+                journal.failed(f"move:{channel.id}", "final export failed")
+                logging.error("Final export of channel '%s' failed, not archiving it.", channel.name)
+        channels = [channel for channel in channels if exported[channel] is not None]
+
+    plans = []
+    for channel in channels:
+        logging.debug("Checking channel: %s", channel.name)
+        plans.append(ChannelPlan(channel.name, archive_category, archive_overwrites, channel=channel,
+                                 inherit=inherit_permissions))
+
+    batch = _batch(scheduler, concurrency)
+    for plan in plans:
+        batch.submit(plan_bucket(guild, plan), journal.wrap(f"move:{plan.channel.id}", apply_plan), guild, plan, index)
+    if progress is not None:
+        progress.total = len(plans)
+    results = await batch.drain(progress)
+
+    for plan, result in zip(plans, results):
+        if isinstance(result, Exception):
+            journal.failed(f"move:{plan.channel.id}", str(result))
+            _note(progress, f"Failed to archive channel '{plan.name}': {result}", logging.ERROR)
+        elif result:
+            moved_channels.append(plan.name)
+            _note(progress, f"Channel '{plan.name}' moved to archive and permissions updated.")
+        else:
+            _note(progress, f"Channel '{plan.name}' is already archived. Skipping.")
+    if not journal.pending():
+        journal.complete()
+    return moved_channels
+
+
+async def populate_channels(guild: discord.Guild, category_name, term, year, course_numbers, concurrency=MAX_CONCURRENCY,
+                            progress=None, scheduler=None):
+    # Create a private "{Category}-{course}-{Term}-{Year}" channel for each course under the category.
+    # Re-running after an interruption only creates the channels that are still missing.
+    index = GuildIndex(guild)
+
+    # Create the category if it does not exist
+    existing_category = index.category(category_name)
+    if not existing_category:
+        existing_category = await index.create_category(category_name)
+        logging.info("Category '%s' created.", category_name)
+
+    # Create channels under the category as private and assign roles
+    lab_tech_role = index.role("Lab Tech")
+    plans = []
+    for course_number in course_numbers:
+        channel_name = f"{category_name}-{course_number}-{term.capitalize()}-{year}"
+        # Existing channels are left alone: they may have been archived or had overwrites added by staff since
+        if index.channel(channel_name):
+            _note(progress, f"Channel '{normalize_channel_name(channel_name)}' already exists. Skipping.")
+            continue
+        role_name = f"{category_name}-{course_number}"
+        role = index.role(role_name)
+        if not role:
+            _note(progress, f"Role '{role_name}' not found for channel '{channel_name}'.", logging.WARNING)
+            continue
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            role: discord.PermissionOverwrite(read_messages=True, send_messages=True),
+            lab_tech_role: discord.PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True)
+        }
+        plans.append(ChannelPlan(channel_name, existing_category, overwrites))
+
+    batch = _batch(scheduler, concurrency)
+    for plan in plans:
+        batch.submit(plan_bucket(guild, plan), apply_plan, guild, plan, index)
+    if progress is not None:
+        progress.total = len(plans)
+    results = await batch.drain(progress)
+
+    created_channels = []
+    for plan, channel in zip(plans, results):
+        if isinstance(channel, Exception):
+            _note(progress, f"Failed to create channel '{plan.name}': {channel}", logging.ERROR)
+        else:
+            created_channels.append(channel.name)
+            _note(progress, f"Channel '{channel.name}' created as private with its course role assigned.")
+    return created_channels
+
+
+# One next-term channel in a rollover manifest; `plan` is None when the channel is not going to be created
+RolloverItem = namedtuple("RolloverItem", ["name", "category_name", "role_name", "plan", "note"])
+
+
+def plan_rollover(index: GuildIndex, term, year, catalog):
+    # Next-term manifest built once from the parsed `term` `year` channels and the course catalog: name, target
+    # category and overwrites of every channel to create, plus the ones skipped and why. Nothing is sent to Discord.
+    guild = index.guild
+    manifest = []
+    seen = set()
+    for channel in index.term(term, year):
+        record = index.parsed[channel.id]
+        next_record = rollover(record)
+        name = next_record.name
+        if name in seen:
+            continue
+        seen.add(name)
+        subject = record.subject.upper()
+        role_name = next_record.key.upper()
+        category = index.category(subject)
+        if int(record.course) not in catalog.get(subject, ()):
+            manifest.append(RolloverItem(name, subject, role_name, None, "not in the course catalog"))
+        elif not category:
+            manifest.append(RolloverItem(name, subject, role_name, None, f"category '{subject}' does not exist"))
+        elif index.channel(name):
+            manifest.append(RolloverItem(name, subject, role_name, None, "already exists"))
+        else:
+            role = index.course_roles.get(next_record.key)
+            overwrites = {
+                guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),
+                role: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            }
+            note = None if role else f"role '{role_name}' not found; created without it"
+            manifest.append(RolloverItem(name, subject, role_name, ChannelPlan(name, category, overwrites), note))
+    return manifest
+
+
+def format_manifest(manifest):
+    # Preview lines, one per channel
+    lines = []
+    for item in manifest:
+        action = "create" if item.plan is not None else "skip"
+        line = f"{action} {item.name} in {item.category_name} (role {item.role_name})"
+        lines.append(f"{line}: {item.note}" if item.note else line)
+    return lines
+
+
+async def create_next_term(guild: discord.Guild, manifest, index=None, concurrency=MAX_CONCURRENCY, progress=None,
+                           journal=None, scheduler=None):
+    # Create every planned channel of a rollover manifest in a single call each, concurrently within the guild's
+    # channel creation bucket. With a journal, channels it records as created (and that still exist) are skipped,
+    # new ones recorded and failures marked; completing the journal is left to the caller, which usually journals
+    # the archive moves in it too.
+    index = index or GuildIndex(guild)
+    journal = journal or JobJournal()
+    items = [item for item in manifest if item.plan is not None]
+    journal.plan({f"create:{item.name}": None for item in items})
+    done = {item.name for item in items
+            if journal.is_done(f"create:{item.name}") and index.channel(item.name)}
+    for item in items:
+        if item.name in done:
+            _note(progress, f"Channel '{item.name}' was created by the interrupted run. Skipping.")
+    items = [item for item in items if item.name not in done]
+
+    batch = _batch(scheduler, concurrency)
+    for item in items:
+        batch.submit(plan_bucket(guild, item.plan), journal.wrap(f"create:{item.name}", apply_plan), guild, item.plan,
+                         index)
+    if progress is not None:
+        progress.total = len(items)
+    results = await batch.drain(progress)
+
+    created_channels = []
+    for item, result in zip(items, results):
+        if isinstance(result, Exception):
+            journal.failed(f"create:{item.name}", str(result))
+            _note(progress, f"Failed to create channel '{item.name}': {result}", logging.ERROR)
+        else:
+            created_channels.append(item.name)
+            _note(progress, f"Created channel '{item.name}' in {item.category_name} with its permissions.")
+            if item.note:
+                _note(progress, f"Channel '{item.name}': {item.note}.", logging.WARNING)
+    return created_channels
+
+
+async def create_course_roles(guild: discord.Guild, categories, concurrency=MAX_CONCURRENCY, index=None, scheduler=None):
+    # Create a "{Category}-{course}" role for every course in `categories` (a catalog as returned by
+    # catalog.load_catalog) that does not have one yet, then order all of them as listed in one call
+    index = index or GuildIndex(guild)
+    batch = _batch(scheduler, concurrency)
+    role_names = course_role_names(categories)
+    pending_roles = [role_name for role_name in role_names if not index.role(role_name)]
+    logging.info("%d of %d catalog roles already exist.", len(role_names) - len(pending_roles), len(role_names))
+    for role_name in pending_roles:
+        batch.submit(guild_bucket(guild, "roles"), index.create_role, name=role_name)
+
+    created_roles = []
+    for role_name, result in zip(pending_roles, await batch.drain()):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to create role '{role_name}': {result}")
+        else:
+            created_roles.append(role_name)
+            logging.info(f"Role '{role_name}' created successfully.")
+
+    # Stack the catalog roles in catalog order (first entry highest) where the lowest of them sits now
+    roles = [index.role(role_name) for role_name in role_names if index.role(role_name)]
+    if roles:
+        base = min(role.position for role in roles)
+        positions = {role: base + len(roles) - 1 - i for i, role in enumerate(roles)}
+        if any(role.position != position for role, position in positions.items()):
+            batch.submit(guild_bucket(guild, "roles"), guild.edit_role_positions, positions=positions)
+            result, = await batch.drain()
+            if isinstance(result, Exception):
+                logging.error(f"Failed to order course roles: {result}")
+            else:
+                logging.info("Ordered %d course roles in one call.", len(positions))
+    return created_roles
+
+
+async def update_labtech_rw_access(guild: discord.Guild, term, year, concurrency=MAX_CONCURRENCY, index=None,
+                                   scheduler=None):
+    # Grant the Lab Tech role read/write access to every channel of `term` `year`
+    logging.info(f"Updating {term.capitalize()} {year} RW access in guild: {guild.name}")
+    index = index or GuildIndex(guild)
+    lab_tech_role = index.role("Lab Tech")
+
+    if not lab_tech_role:
+        logging.error("Lab Tech role not found in the guild.")
+        return []
+
+    overwrite = discord.PermissionOverwrite(
+        read_messages=True,
+        send_messages=True,
+        read_message_history=True
+    )
+    batch = _batch(scheduler, concurrency)
+    matched_channels = []
+    for channel in index.term(term, year):
+        batch.submit(channel_bucket(channel), channel.set_permissions, lab_tech_role, overwrite=overwrite)
+        matched_channels.append(channel)
+
+    updated_channels = []
+    for channel, result in zip(matched_channels, await batch.drain()):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to update '{channel.name}': {result}")
+        else:
+            updated_channels.append(channel.name)
+            logging.info(f"Granted RW access to Lab Tech for '{channel.name}'")
+
+    if updated_channels:
+        logging.info(f"Updated {len(updated_channels)} channels: {', '.join(updated_channels)}")
+    else:
+        logging.info("No matching channels found.")
+    return updated_channels
+
+
+async def export_term(guild: discord.Guild, term, year, root=EXPORT_ROOT, concurrency=EXPORT_CONCURRENCY, progress=None,
+                      attachments=False):
+    # Export the message history of every channel of `term` `year`, several channels at once, optionally
+    # with attachments; returns {channel name: messages exported, or None if that channel's export failed}
+    index = GuildIndex(guild)
+    channels = index.term(term, year)
+    if attachments:
+        async with AttachmentDownloader(root=os.path.join(root, "blobs")) as downloader:
+            exported = await export_channels(channels, root=root, concurrency=concurrency, progress=progress,
+                                             downloader=downloader)
+    else:
+        exported = await export_channels(channels, root=root, concurrency=concurrency, progress=progress)
+    return {channel.name: count for channel, count in exported.items()}